@@ -0,0 +1,71 @@
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Any
+
+from benchmarks.corpus import sample_paragraphs
+
+
+BATCH_SIZES = [1, 8, 32, 128]
+
+
+def measure_backend(backend: str, texts: List[str], batch_sizes: List[int], repeat: int) -> Dict[str, Any]:
+    from embeddings import create_embedding_function
+
+    start = time.perf_counter()
+    embedding = create_embedding_function(backend)
+    embedding.embed_query('warm-up')
+    result = {'load_seconds': round(time.perf_counter() - start, 3), 'texts_per_second': {}}
+
+    for batch_size in batch_sizes:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for i in range(0, len(texts), batch_size):
+                embedding.embed_documents(texts[i:i + batch_size])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result['texts_per_second'][str(batch_size)] = round(len(texts) / best, 1)
+    return result
+
+
+def main():
+    from embeddings import EMBEDDING_BACKENDS, EMBEDDING_PARITY_THRESHOLD, create_embedding_function, parity_check
+
+    parser = argparse.ArgumentParser(description='Benchmark of embedding throughput and parity across backends.')
+    parser.add_argument('--backends', default=','.join(EMBEDDING_BACKENDS), help='comma-separated embedding backends')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--texts', type=int, default=256, help='number of sample texts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=EMBEDDING_PARITY_THRESHOLD, help='minimum cosine to torch')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    texts = sample_paragraphs(args.texts)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    reference_vectors = create_embedding_function('torch').embed_documents(texts)
+
+    results = {'texts': len(texts), 'backends': {}}
+    failed = []
+    for backend in args.backends.split(','):
+        result = measure_backend(backend, texts, batch_sizes, args.repeat)
+        result['parity'] = parity_check(texts, backend, threshold=args.threshold, reference_vectors=reference_vectors)
+        results['backends'][backend] = result
+        throughput = '  '.join(f'b{size}: {rate:8.1f}/s' for size, rate in result['texts_per_second'].items())
+        print(f"{backend:10} load {result['load_seconds']:6.2f}s  {throughput}  "
+              f"min cosine {result['parity']['min_cosine']:.4f}")
+        if not result['parity']['passed']:
+            failed.append(backend)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if failed:
+        print(f"Backends below the {args.threshold} cosine threshold: {', '.join(failed)}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
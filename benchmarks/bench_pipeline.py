@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+from typing import Dict, List, Any
+
+os.environ.setdefault('COLLECTION_NAME', 'bench_chunks')
+os.environ.setdefault('MONGO_DB_NAME', 'bench')
+os.environ.setdefault('GEMINI_API_KEY', 'fake')
+os.environ.setdefault('LLM_DEFAULT_RPM', '1000000')
+
+from benchmarks.corpus import CORPUS_SIZES, build_corpus
+
+
+COMPARED_METRICS = ['wall_seconds', 'llm_calls', 'prompt_tokens', 'response_tokens', 'peak_rss_mb']
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_pipeline(files_paths: List[str], latency: float, latency_per_1k_tokens: float) -> Dict[str, Any]:
+    import tiktoken
+    import generate_course
+    from llm_gateway import gateway
+    from benchmarks.fakes import CallCounter, FakeGenaiClient, SharedQdrantClient, InMemoryMongoClient
+
+    counter = CallCounter()
+    mongo_client = InMemoryMongoClient()
+    gateway.client = FakeGenaiClient(counter, tiktoken.get_encoding('cl100k_base'), latency, latency_per_1k_tokens)
+    generate_course.QdrantClient = SharedQdrantClient(generate_course.COLLECTION_NAME)
+    generate_course.MongoClient = mongo_client
+
+    stages = []
+    start = time.perf_counter()
+    stage_start = start
+    for message in generate_course.generate_course('bench-user', 'Bench Course', files_paths):
+        if message.get('event') == 'metrics':
+            continue
+        now = time.perf_counter()
+        snapshot = counter.snapshot()
+        counter.reset()
+        mongo_round_trips = mongo_client.counter.round_trips
+        mongo_client.counter.round_trips = 0
+        stages.append({
+            'stage': message['data'],
+            'wall_seconds': round(now - stage_start, 4),
+            'llm_calls': sum(snapshot['llm_calls'].values()),
+            'llm_calls_by_model': snapshot['llm_calls'],
+            'prompt_tokens': snapshot['prompt_tokens'],
+            'response_tokens': snapshot['response_tokens'],
+            'mongo_round_trips': mongo_round_trips,
+        })
+        stage_start = now
+
+    return {
+        'wall_seconds': round(time.perf_counter() - start, 4),
+        'llm_calls': sum(stage['llm_calls'] for stage in stages),
+        'prompt_tokens': sum(stage['prompt_tokens'] for stage in stages),
+        'response_tokens': sum(stage['response_tokens'] for stage in stages),
+        'mongo_round_trips': sum(stage['mongo_round_trips'] for stage in stages),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': stages,
+    }
+
+
+def run_corpus(name: str, corpus_dir: str, latency: float, latency_per_1k_tokens: float) -> Dict[str, Any]:
+    # Each corpus runs in its own interpreter so peak RSS is not shared between runs.
+    command = [
+        sys.executable, '-m', 'benchmarks.bench_pipeline', '--single', name,
+        '--corpus-dir', corpus_dir,
+        '--latency', str(latency),
+        '--latency-per-1k-tokens', str(latency_per_1k_tokens),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results['corpora'].items():
+        base = baseline.get('corpora', {}).get(name)
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            line = f'{name:8} {metric:16} {base[metric]:>12} -> {result[metric]:>12} ({change:+.1%})'
+            print(line)
+            if change > tolerance:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the course generation pipeline.')
+    parser.add_argument('--corpora', default=','.join(CORPUS_SIZES), help='comma-separated corpus names')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'course-bench-corpus'))
+    parser.add_argument('--latency', type=float, default=0.0, help='fake LLM latency per call in seconds')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.0, help='extra fake latency per 1000 tokens')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        files_paths = build_corpus(args.corpus_dir, args.single)
+        result = run_pipeline(files_paths, args.latency, args.latency_per_1k_tokens)
+        print(json.dumps(result))
+        return
+
+    results = {
+        'settings': {'latency': args.latency, 'latency_per_1k_tokens': args.latency_per_1k_tokens},
+        'corpora': {},
+    }
+    for name in args.corpora.split(','):
+        build_corpus(args.corpus_dir, name)
+        results['corpora'][name] = run_corpus(name, args.corpus_dir, args.latency, args.latency_per_1k_tokens)
+        corpus = results['corpora'][name]
+        print(f"{name:8} {corpus['wall_seconds']:8.2f}s  {corpus['llm_calls']:4} LLM calls  "
+              f"{corpus['prompt_tokens'] + corpus['response_tokens']:8} tokens  {corpus['peak_rss_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} metrics regressed by more than {args.tolerance:.0%}.')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
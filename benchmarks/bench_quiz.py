@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+from typing import Dict, List, Any
+
+os.environ.setdefault('MONGO_DB_NAME', 'bench')
+os.environ.setdefault('GEMINI_API_KEY', 'fake')
+os.environ.setdefault('LLM_DEFAULT_RPM', '1000000')
+# LLM selection keeps the benchmark free of the embedding model and bound by LLM latency.
+os.environ.setdefault('MODULE_QUIZ_SELECTION', 'llm')
+
+
+def seed_course(mongo_db, question_num: int) -> str:
+    from course_store import insert_course
+    from benchmarks.fakes import fake_response
+    from generate_course import parse_questions
+
+    questions = parse_questions(fake_response(f'Generate exactly {question_num} multiple-choice questions'))
+    return insert_course(mongo_db, {'title': 'Bench Course', 'creator_username': 'bench-user'}, [
+        {'number': 1, 'title': 'Bench Module', 'summary': 'Bench module.', 'content': 'Bench content.', 'questions': questions}
+    ])
+
+
+def record_attempt(mongo_db, course_id: str, user_id: str, question_num: int, rng: random.Random) -> str:
+    result = mongo_db['quiz_attempts'].insert_one({
+        'course_id': course_id,
+        'user_id': user_id,
+        'module_number': 1,
+        'answers': [
+            {'question_index': index, 'is_correct': rng.random() < 0.6}
+            for index in rng.sample(range(question_num), min(10, question_num))
+        ]
+    })
+    return str(result.inserted_id)
+
+
+def run(attempts: int, question_num: int, latency: float) -> Dict[str, Any]:
+    import tiktoken
+    import generate_quiz
+    from llm_gateway import gateway
+    from benchmarks.fakes import CallCounter, FakeGenaiClient, InMemoryMongoClient
+
+    counter = CallCounter()
+    mongo_client = InMemoryMongoClient()
+    gateway.client = FakeGenaiClient(counter, tiktoken.get_encoding('cl100k_base'), latency)
+    generate_quiz.MongoClient = mongo_client
+    mongo_db = mongo_client[os.environ['MONGO_DB_NAME']]
+    course_id = seed_course(mongo_db, question_num)
+    generate_quiz.ensure_pregeneration_indexes()
+    rng = random.Random(0)
+
+    cold: List[float] = []
+    for i in range(attempts):
+        attempt_id = record_attempt(mongo_db, course_id, f'cold-{i}', question_num, rng)
+        start = time.perf_counter()
+        generate_quiz.generate_module_quiz(attempt_id)
+        cold.append(time.perf_counter() - start)
+    cold_llm_calls = sum(counter.snapshot()['llm_calls'].values())
+    counter.reset()
+
+    pregenerated: List[float] = []
+    for i in range(attempts):
+        user_id = f'pregenerated-{i}'
+        attempt_id = record_attempt(mongo_db, course_id, user_id, question_num, rng)
+        generate_quiz.schedule_module_quiz_pregeneration(attempt_id)
+        # The learner reads their results while the next quiz is built.
+        generate_quiz._pregenerations[attempt_id].result()
+        stored = mongo_db['pregenerated_quizzes'].find_one({'_id': attempt_id})
+        assert stored is not None, 'the quiz was not pre-generated'
+
+        start = time.perf_counter()
+        generate_quiz.generate_module_quiz(attempt_id)
+        pregenerated.append(time.perf_counter() - start)
+
+        quiz = mongo_db['quizzes'].find_one({'course_id': course_id, 'user_id': user_id})
+        assert quiz['questions'] == stored['questions'], 'the served quiz is not the pre-generated one'
+        assert mongo_db['pregenerated_quizzes'].find_one({'_id': attempt_id}) is None, 'the pre-generated quiz was not consumed'
+
+    return {
+        'attempts': attempts,
+        'cold_p50_seconds': round(statistics.median(cold), 4),
+        'pregenerated_p50_seconds': round(statistics.median(pregenerated), 4),
+        'cold_llm_calls': cold_llm_calls,
+        'pregenerated_llm_calls': sum(counter.snapshot()['llm_calls'].values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of module quiz pre-generation.')
+    parser.add_argument('--attempts', type=int, default=20, help='quiz attempts per mode')
+    parser.add_argument('--questions', type=int, default=40, help='questions in the module question bank')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake LLM latency per call in seconds')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    result = run(args.attempts, args.questions, args.latency)
+    print(f"cold {result['cold_p50_seconds']:.4f}s p50  pre-generated {result['pregenerated_p50_seconds']:.4f}s p50  "
+          f"LLM calls {result['cold_llm_calls']} -> {result['pregenerated_llm_calls']} (in the background)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Any
+
+from benchmarks.bench_pipeline import peak_rss_mb
+
+
+MODULES = ['main', 'chatbot', 'generate_course', 'generate_quiz']
+COMPARED_METRICS = ['import_seconds', 'import_rss_mb', 'warm_up_seconds']
+
+
+def measure(module: str, components: List[str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    __import__(module)
+    import_seconds = time.perf_counter() - start
+    import_rss_mb = peak_rss_mb()
+
+    import warmup
+    start = time.perf_counter()
+    status = warmup.warm_up(components)
+    return {
+        'import_seconds': round(import_seconds, 4),
+        'import_rss_mb': round(import_rss_mb, 1),
+        'warm_up_seconds': round(time.perf_counter() - start, 4),
+        'warm_up_rss_mb': round(peak_rss_mb(), 1),
+        'components': status,
+    }
+
+
+def run_module(module: str, components: List[str], repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        # A fresh interpreter per run so nothing is already imported or cached in memory.
+        command = [
+            sys.executable, '-m', 'benchmarks.bench_startup',
+            '--single', module, '--components', ','.join(components),
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = {metric: statistics.median(run[metric] for run in runs) for metric in COMPARED_METRICS + ['warm_up_rss_mb']}
+    result['components'] = runs[-1]['components']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of API import and warm-up time.')
+    parser.add_argument('--modules', default=','.join(MODULES), help='comma-separated modules to import')
+    parser.add_argument('--components', default='embeddings,tokenizer,llm', help='warm-up components')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    components = [component for component in args.components.split(',') if component]
+    if args.single:
+        os.environ.setdefault('WARM_UP_ON_STARTUP', 'false')
+        print(json.dumps(measure(args.single, components)))
+        return
+
+    results = {'components': components, 'modules': {}}
+    for module in args.modules.split(','):
+        result = run_module(module, components, args.repeat)
+        results['modules'][module] = result
+        print(f"{module:16} import {result['import_seconds']:7.3f}s  {result['import_rss_mb']:8.1f} MB  "
+              f"warm-up {result['warm_up_seconds']:7.3f}s  {result['warm_up_rss_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = []
+        for module, result in results['modules'].items():
+            base = baseline.get('modules', {}).get(module)
+            if base is None:
+                continue
+            for metric in COMPARED_METRICS:
+                if not base.get(metric):
+                    continue
+                change = (result[metric] - base[metric]) / base[metric]
+                line = f'{module:16} {metric:16} {base[metric]:>10} -> {result[metric]:>10} ({change:+.1%})'
+                print(line)
+                if change > args.tolerance:
+                    regressions.append(line)
+        if regressions:
+            print(f'{len(regressions)} metrics regressed by more than {args.tolerance:.0%}.')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import os
+import random
+from typing import List, Dict
+
+
+CORPUS_SIZES: Dict[str, int] = {
+    'small': 3,
+    'medium': 20,
+    'large': 80,
+}
+
+VOCABULARY = (
+    'block chain ledger consensus network node transaction hash signature protocol '
+    'validator proof stake work token contract state storage latency throughput '
+    'security privacy key encryption verification model layer attention vector '
+    'embedding retrieval index query document learning gradient training data'
+).split()
+
+LINE_WIDTH = 90
+LINES_PER_PAGE = 48
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _page_lines(rng: random.Random, page_number: int) -> List[str]:
+    lines = [f'Section {page_number}: {rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY).title()}', '']
+    while len(lines) < LINES_PER_PAGE:
+        paragraph = ' '.join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        while paragraph and len(lines) < LINES_PER_PAGE:
+            cut = paragraph.rfind(' ', 0, LINE_WIDTH) if len(paragraph) > LINE_WIDTH else len(paragraph)
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        lines.append('')
+    return lines[:LINES_PER_PAGE]
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(file_path: str, pages: List[List[str]]):
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', b'']
+    font_id = 3
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    page_ids = []
+    for lines in pages:
+        stream = 'BT /F1 11 Tf 14 TL 50 760 Td\n'
+        stream += '\n'.join(f'({_escape(line)}) Tj T*' for line in lines)
+        stream += '\nET'
+        stream = stream.encode('latin-1')
+        objects.append(b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append((
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        page_ids.append(len(objects))
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode()
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f'{i} 0 obj\n'.encode() + obj + b'\nendobj\n'
+    xref_offset = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        output += f'{offset:010d} 00000 n \n'.encode()
+    output += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+
+    with open(file_path, 'wb') as f:
+        f.write(output)
+
+
+def build_corpus(directory: str, name: str, seed: int = 0) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(f'{name}-{seed}')
+    file_path = os.path.join(directory, f'{name}.pdf')
+    if not os.path.exists(file_path):
+        pages = [_page_lines(rng, i) for i in range(1, CORPUS_SIZES[name] + 1)]
+        write_pdf(file_path, pages)
+    return [file_path]
+
+
+def sample_paragraphs(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(f'paragraphs-{seed}')
+    return [' '.join(_sentence(rng) for _ in range(rng.randint(1, 8))) for _ in range(count)]
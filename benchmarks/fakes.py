@@ -0,0 +1,408 @@
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional
+from bson import ObjectId
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+
+
+VECTOR_SIZE = 384
+
+FAKE_VOCABULARY = (
+    'concept principle mechanism example definition property process structure '
+    'method system component advantage limitation application analysis result'
+).split()
+
+
+class CallCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls: Dict[str, int] = defaultdict(int)
+            self.prompt_tokens = 0
+            self.response_tokens = 0
+
+    def record(self, model: str, prompt_tokens: int, response_tokens: int):
+        with self.lock:
+            self.calls[model] += 1
+            self.prompt_tokens += prompt_tokens
+            self.response_tokens += response_tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'llm_calls': dict(self.calls),
+                'prompt_tokens': self.prompt_tokens,
+                'response_tokens': self.response_tokens,
+            }
+
+
+class FakeModels:
+    def __init__(self, counter: CallCounter, latency: float, latency_per_1k_tokens: float, encoding):
+        self.counter = counter
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.encoding = encoding
+
+    def generate_content(self, model: str, contents, config=None):
+        prompt = contents if isinstance(contents, str) else str(contents)
+        structured = isinstance(config, dict) and config.get('response_mime_type') == 'application/json'
+        text = fake_response(prompt, structured)
+        prompt_tokens = len(self.encoding.encode(prompt))
+        response_tokens = len(self.encoding.encode(text))
+        time.sleep(self.latency + self.latency_per_1k_tokens * (prompt_tokens + response_tokens) / 1000)
+        self.counter.record(model, prompt_tokens, response_tokens)
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=response_tokens
+            )
+        )
+
+
+class FakeGenaiClient:
+    def __init__(self, counter: CallCounter, encoding, latency: float = 0.0, latency_per_1k_tokens: float = 0.0):
+        self.models = FakeModels(counter, latency, latency_per_1k_tokens, encoding)
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return ' '.join(rng.choice(FAKE_VOCABULARY) for _ in range(n))
+
+
+def _questions(rng: random.Random, n: int, structured: bool = False) -> str:
+    if structured:
+        return json.dumps([
+            {
+                'question': f'What is the {_words(rng, 6)}?',
+                'options': {option: f'{option} {_words(rng, 4)}' for option in 'abcd'},
+                'answer': rng.choice('abcd')
+            }
+            for _ in range(n)
+        ])
+
+    text = ''
+    for i in range(1, n + 1):
+        text += f'{i}. What is the {_words(rng, 6)}?\n'
+        for option in 'abcd':
+            text += f'{option}) {_words(rng, 4)}\n'
+        text += f'Answer: {rng.choice("abcd")}\n\n'
+    return text
+
+
+def fake_response(prompt: str, structured: bool = False) -> str:
+    rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+    lowered = prompt.lower()
+
+    if '<chunk id=' in lowered:
+        # Packed summarization: answer every chunk id except, now and then, one to exercise the fallback.
+        ids = re.findall(r'<chunk id="(\d+)">', prompt)
+        skipped = rng.choice(ids) if len(ids) > 2 and rng.random() < 0.1 else None
+        return '\n'.join(f'<summary id="{id}">{_words(rng, 60)}</summary>' for id in ids if id != skipped)
+    if 'course outline' in lowered:
+        match = re.search(r'exactly (\d+)-(\d+) modules', lowered)
+        module_num = int(match.group(2)) if match else 5
+        return '\n\n'.join(
+            f'**Module {i}: {_words(rng, 3).title()}**\nSummary: {_words(rng, 90)}'
+            for i in range(1, module_num + 1)
+        )
+    if 'related questions' in lowered:
+        # Module quiz selection: pick question numbers from the listed database.
+        available = prompt[lowered.index('available questions'):]
+        numbers = sorted(set(re.findall(r'^(\d+)\.', available, re.M)), key=int)
+        return ', '.join(rng.sample(numbers, min(10, len(numbers))))
+    if 'multiple-choice questions' in lowered:
+        match = re.search(r'exactly \**(\d+)', lowered)
+        return _questions(rng, int(match.group(1)) if match else 20, structured)
+    if 'submodule' in lowered:
+        return '\n\n'.join(f'## {_words(rng, 3).title()}\n\n{_words(rng, 150)}' for _ in range(4))
+    if 'summary for a learning course' in lowered:
+        return _words(rng, 40)
+    return _words(rng, 60)
+
+
+class SharedQdrantClient:
+    def __init__(self, collection_name: str):
+        self.client = QdrantClient(':memory:')
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
+        )
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def close(self, *args, **kwargs):
+        pass
+
+
+def _get_path(doc: Dict, path: str):
+    value = doc
+    for key in path.split('.'):
+        if isinstance(value, list):
+            value = [item.get(key) for item in value if isinstance(item, dict)]
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            return None
+    return value
+
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        for operator, operand in condition.items():
+            if operator == '$in' and not any(_match_value(value, item) for item in operand):
+                return False
+            if operator == '$nin' and any(_match_value(value, item) for item in operand):
+                return False
+            if operator == '$ne' and _match_value(value, operand):
+                return False
+            if operator == '$exists' and (value is not None) != operand:
+                return False
+            if operator in ('$gt', '$gte', '$lt', '$lte'):
+                if value is None:
+                    return False
+                if operator == '$gt' and not value > operand:
+                    return False
+                if operator == '$gte' and not value >= operand:
+                    return False
+                if operator == '$lt' and not value < operand:
+                    return False
+                if operator == '$lte' and not value <= operand:
+                    return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def _matches(doc: Dict, query: Optional[Dict]) -> bool:
+    return all(_match_value(_get_path(doc, path), condition) for path, condition in (query or {}).items())
+
+
+def _project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+
+    include_id = projection.get('_id', 1)
+    fields = [field for field, flag in projection.items() if field != '_id' and flag]
+    if not fields:
+        excluded = [field for field, flag in projection.items() if not flag]
+        for field in excluded:
+            doc.pop(field, None)
+        return doc
+
+    result = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        if head not in doc:
+            continue
+        if not rest:
+            result[head] = doc[head]
+        elif isinstance(doc[head], list):
+            projected = [_project(item, {rest: 1, '_id': 1}) for item in doc[head] if isinstance(item, dict)]
+            existing = result.setdefault(head, [{} for _ in projected])
+            for target, source in zip(existing, projected):
+                target.update(source)
+        elif isinstance(doc[head], dict):
+            result.setdefault(head, {}).update(_project(doc[head], {rest: 1, '_id': 1}))
+    if include_id and '_id' in doc:
+        result['_id'] = doc['_id']
+    return result
+
+
+class InMemoryCursor:
+    def __init__(self, docs: List[Dict]):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (_get_path(doc, field) is None, _get_path(doc, field)), reverse=order < 0)
+        return self
+
+    def limit(self, n: int):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class InMemoryCollection:
+    def __init__(self, counter: 'MongoCounter'):
+        self.docs: List[Dict] = []
+        self.lock = threading.Lock()
+        self.counter = counter
+
+    def create_index(self, *args, **kwargs):
+        self.counter.record()
+        return 'index'
+
+    def insert_one(self, doc: Dict):
+        self.counter.record()
+        doc.setdefault('_id', ObjectId())
+        with self.lock:
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    def insert_many(self, docs: List[Dict], ordered: bool = True):
+        self.counter.record()
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+        with self.lock:
+            self.docs.extend(copy.deepcopy(doc) for doc in docs)
+        return SimpleNamespace(inserted_ids=[doc['_id'] for doc in docs])
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        self.counter.record()
+        with self.lock:
+            return InMemoryCursor([_project(doc, projection) for doc in self.docs if _matches(doc, query)])
+
+    def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor), None)
+
+    def count_documents(self, query: Dict):
+        self.counter.record()
+        with self.lock:
+            return sum(1 for doc in self.docs if _matches(doc, query))
+
+    def _apply_update(self, doc: Dict, update: Dict):
+        for operator, fields in update.items():
+            for field, value in fields.items():
+                if operator == '$set':
+                    doc[field] = copy.deepcopy(value)
+                elif operator == '$inc':
+                    doc[field] = doc.get(field, 0) + value
+                elif operator == '$addToSet':
+                    items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                    doc.setdefault(field, [])
+                    doc[field] += [item for item in items if item not in doc[field]]
+                elif operator == '$push':
+                    doc.setdefault(field, []).append(copy.deepcopy(value))
+                elif operator == '$unset':
+                    doc.pop(field, None)
+
+    def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        self.counter.record()
+        with self.lock:
+            for doc in self.docs:
+                if _matches(doc, query):
+                    self._apply_update(doc, update)
+                    return SimpleNamespace(matched_count=1, upserted_id=None)
+            if upsert:
+                doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+                doc['_id'] = doc.get('_id', ObjectId())
+                self._apply_update(doc, update)
+                self.docs.append(doc)
+                return SimpleNamespace(matched_count=0, upserted_id=doc['_id'])
+        return SimpleNamespace(matched_count=0, upserted_id=None)
+
+    def replace_one(self, query: Dict, replacement: Dict, upsert: bool = False):
+        self.counter.record()
+        with self.lock:
+            for i, doc in enumerate(self.docs):
+                if _matches(doc, query):
+                    self.docs[i] = {'_id': doc['_id'], **copy.deepcopy(replacement)}
+                    return SimpleNamespace(matched_count=1, upserted_id=None)
+            if upsert:
+                doc = {'_id': query.get('_id', ObjectId()), **copy.deepcopy(replacement)}
+                self.docs.append(doc)
+                return SimpleNamespace(matched_count=0, upserted_id=doc['_id'])
+        return SimpleNamespace(matched_count=0, upserted_id=None)
+
+    def update_many(self, query: Dict, update: Dict):
+        self.counter.record()
+        matched = 0
+        with self.lock:
+            for doc in self.docs:
+                if _matches(doc, query):
+                    self._apply_update(doc, update)
+                    matched += 1
+        return SimpleNamespace(matched_count=matched)
+
+    def delete_one(self, query: Dict):
+        self.counter.record()
+        with self.lock:
+            for i, doc in enumerate(self.docs):
+                if _matches(doc, query):
+                    del self.docs[i]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def find_one_and_delete(self, query: Dict):
+        self.counter.record()
+        with self.lock:
+            for i, doc in enumerate(self.docs):
+                if _matches(doc, query):
+                    return self.docs.pop(i)
+        return None
+
+    def delete_many(self, query: Dict):
+        self.counter.record()
+        with self.lock:
+            kept = [doc for doc in self.docs if not _matches(doc, query)]
+            deleted = len(self.docs) - len(kept)
+            self.docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+
+class MongoCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.round_trips = 0
+
+    def record(self):
+        with self.lock:
+            self.round_trips += 1
+
+
+class InMemoryDatabase:
+    def __init__(self, counter: MongoCounter):
+        self.counter = counter
+        self.collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self.collections:
+            self.collections[name] = InMemoryCollection(self.counter)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+
+class InMemoryMongoClient:
+    def __init__(self):
+        self.counter = MongoCounter()
+        self.databases: Dict[str, InMemoryDatabase] = {}
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        if name not in self.databases:
+            self.databases[name] = InMemoryDatabase(self.counter)
+        return self.databases[name]
+
+    def close(self):
+        pass
@@ -0,0 +1,98 @@
+import os
+import zlib
+import threading
+from typing import List, Dict, Optional, Tuple, Union
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+
+
+# Turns longer than this are kept zlib-compressed once they are no longer among the recent ones.
+CHAT_HISTORY_RECENT_TURNS = int(os.getenv('CHAT_HISTORY_RECENT_TURNS', 8))
+CHAT_HISTORY_COMPRESS_MIN_CHARS = int(os.getenv('CHAT_HISTORY_COMPRESS_MIN_CHARS', 512))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 20))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 100))
+# Only the latest turns go into the prompt; by default these are the ones still kept uncompressed.
+CHAT_HISTORY_PROMPT_TURNS = int(os.getenv('CHAT_HISTORY_PROMPT_TURNS', CHAT_HISTORY_RECENT_TURNS))
+
+Text = Union[str, bytes]
+Turn = Tuple[Text, Text]
+
+
+def _pack(human: str, ai: str) -> Turn:
+    # Each side is compressed on its own so that no separator can clash with the message text.
+    if len(human) + len(ai) < CHAT_HISTORY_COMPRESS_MIN_CHARS:
+        return human, ai
+    return zlib.compress(human.encode('utf-8')), zlib.compress(ai.encode('utf-8'))
+
+
+def _unpack_text(text: Text) -> str:
+    return zlib.decompress(text).decode('utf-8') if isinstance(text, bytes) else text
+
+
+def _unpack(turn: Turn) -> Tuple[str, str]:
+    human, ai = turn
+    return _unpack_text(human), _unpack_text(ai)
+
+
+class ChatHistory:
+    # One (human, ai) pair per turn; the turn's position in the list is its index.
+    __slots__ = ('turns', 'lock')
+
+    def __init__(self):
+        self.turns: List[Turn] = []
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add_turn(self, human: str, ai: str):
+        with self.lock:
+            self.turns.append((human, ai))
+            old = len(self.turns) - 1 - CHAT_HISTORY_RECENT_TURNS
+            if old >= 0 and isinstance(self.turns[old][0], str):
+                self.turns[old] = _pack(*self.turns[old])
+
+    def _turns(self, start: int, end: int) -> List[Dict]:
+        with self.lock:
+            selected = self.turns[start:end]
+        return [
+            {'index': index, 'human': human, 'ai': ai}
+            for index, (human, ai) in enumerate(map(_unpack, selected), start)
+        ]
+
+    def recent_messages(self, turns: int = CHAT_HISTORY_PROMPT_TURNS) -> List[BaseMessage]:
+        messages = []
+        total = len(self.turns)
+        for turn in self._turns(max(0, total - turns), total):
+            messages.append(HumanMessage(content=turn['human']))
+            messages.append(AIMessage(content=turn['ai']))
+        return messages
+
+    @staticmethod
+    def _limit(limit: int) -> int:
+        # A client cannot make one request decompress the whole history.
+        return max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))
+
+    def page(self, cursor: Optional[int] = None, limit: int = CHAT_HISTORY_PAGE_SIZE) -> Dict:
+        # Pages go backwards from the newest turn; the cursor is the index the next page ends before.
+        total = len(self.turns)
+        end = total if cursor is None else max(0, min(cursor, total))
+        start = max(0, end - self._limit(limit))
+        return {
+            'turns': self._turns(start, end),
+            'next_cursor': start if start > 0 else None,
+            'total': total
+        }
+
+    def since(self, index: int, limit: int = CHAT_HISTORY_PAGE_SIZE) -> Dict:
+        total = len(self.turns)
+        start = max(0, min(index, total))
+        end = min(total, start + self._limit(limit))
+        return {
+            'turns': self._turns(start, end),
+            'next_since': end,
+            'total': total
+        }
+
+    def legacy(self) -> Dict[str, List[str]]:
+        turns = self._turns(0, len(self.turns))
+        return {'Human': [turn['human'] for turn in turns], 'AI': [turn['ai'] for turn in turns]}
@@ -0,0 +1,88 @@
+import os
+import re
+
+
+# Chat turns that need no new course context skip retrieval: small talk goes to the small
+# model without context and short follow-ups reuse the context of the previous turn.
+CHAT_ROUTER = os.getenv('CHAT_ROUTER', 'true').lower() == 'true'
+CHAT_FOLLOW_UP_MAX_WORDS = int(os.getenv('CHAT_FOLLOW_UP_MAX_WORDS', 12))
+
+ROUTE_SMALL_TALK = 'small_talk'
+ROUTE_FOLLOW_UP = 'follow_up'
+ROUTE_RETRIEVE = 'retrieve'
+
+SMALL_TALK_PHRASES = re.compile(
+    r"\b(hi|hello|hey|hiya|yo|greetings|good (morning|afternoon|evening|night)|"
+    r"thanks|thank you|thx|ty|ok|okay|cool|great|nice|awesome|perfect|got it|i see|"
+    r"bye|goodbye|see you|see ya|how are you|how is it going|who are you|what can you do)\b"
+)
+FILLER_WORDS = {'there', 'again', 'so', 'much', 'a', 'lot', 'very', 'you', 'bot', 'assistant', 'and', 'later', 'doing'}
+
+# A follow-up is made only of back-references and request words; any other word is new content
+# that needs retrieval, so "why?" reuses context while "why is proof of stake secure?" does not.
+BACK_REFERENCE_WORDS = {
+    'it', 'its', 'this', 'that', 'these', 'those', 'they', 'them', 'their', 'above', 'previous',
+    'more', 'again', 'elaborate', 'example', 'examples', 'simpler', 'simply', 'detail', 'details',
+    'why', 'else', 'further', 'another', 'continue', 'clarify', 'rephrase', 'shorter', 'briefly'
+}
+REQUEST_WORDS = {
+    'can', 'could', 'would', 'you', 'please', 'give', 'me', 'us', 'show', 'tell', 'explain', 'say',
+    'a', 'an', 'the', 'one', 'in', 'of', 'on', 'about', 'and', 'so', 'how', 'what', 'is', 'was',
+    'do', 'does', 'did', 'mean', 'meant', 'go', 'some', 'other', 'little', 'bit', 'way', 'words', 'terms',
+    'ok', 'okay', 'i', 'don\'t', 'dont', 'understand', 'get'
+}
+
+
+def _normalize(message: str) -> str:
+    return ' '.join(re.sub(r"[^\w\s']", ' ', message.lower()).split())
+
+
+def is_small_talk(message: str) -> bool:
+    text = _normalize(message)
+    if not text or not SMALL_TALK_PHRASES.search(text):
+        return False
+    # Only a message made of nothing but small-talk phrases counts, so "hi, what is a hash?" still retrieves.
+    rest = SMALL_TALK_PHRASES.sub(' ', text).split()
+    return all(word in FILLER_WORDS for word in rest)
+
+
+def is_follow_up(message: str) -> bool:
+    words = _normalize(message).split()
+    if not 0 < len(words) <= CHAT_FOLLOW_UP_MAX_WORDS:
+        return False
+    return (
+        any(word in BACK_REFERENCE_WORDS for word in words)
+        and all(word in BACK_REFERENCE_WORDS or word in REQUEST_WORDS for word in words)
+    )
+
+
+def route_message(message: str, has_previous_context: bool) -> str:
+    if not CHAT_ROUTER:
+        return ROUTE_RETRIEVE
+    if is_small_talk(message):
+        return ROUTE_SMALL_TALK
+    if has_previous_context and is_follow_up(message):
+        return ROUTE_FOLLOW_UP
+    return ROUTE_RETRIEVE
+
+
+if __name__ == '__main__':
+    checks = [
+        ('Hi', False, ROUTE_SMALL_TALK),
+        ('Thanks a lot!', True, ROUTE_SMALL_TALK),
+        ('hi, what is a transformer?', True, ROUTE_RETRIEVE),
+        ('why?', True, ROUTE_FOLLOW_UP),
+        ('why?', False, ROUTE_RETRIEVE),
+        ('Give an example', True, ROUTE_FOLLOW_UP),
+        ('Can you give an example of it?', True, ROUTE_FOLLOW_UP),
+        ('Explain that more simply', True, ROUTE_FOLLOW_UP),
+        ('What is a transformer and how does it work?', True, ROUTE_RETRIEVE),
+        ('Why is proof of stake more secure than proof of work?', True, ROUTE_RETRIEVE),
+        ('How does attention work in this model?', True, ROUTE_RETRIEVE),
+        ('Can you also explain hashing?', True, ROUTE_RETRIEVE),
+        ('What is that consensus algorithm?', True, ROUTE_RETRIEVE),
+    ]
+    for message, has_previous_context, expected in checks:
+        route = route_message(message, has_previous_context)
+        assert route == expected, f'{message!r}: expected {expected}, got {route}'
+    print(f'{len(checks)} routing checks passed.')
@@ -1,17 +1,20 @@
 import os
+import time
+import threading
 from typing import Dict, Any
 from bson import ObjectId
 from pymongo import MongoClient
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-from langchain_qdrant import QdrantVectorStore
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
 
+import metrics
+from embeddings import get_embedding_function
+from retrieval import search, fetch_chunks, point_chunk_id
+from llm_gateway import gateway, LANE_INTERACTIVE
+from chat_router import route_message, ROUTE_SMALL_TALK, ROUTE_FOLLOW_UP
+from chat_history import ChatHistory, CHAT_HISTORY_PAGE_SIZE
+
 
 load_dotenv()
 
@@ -22,18 +25,42 @@ QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+MODEL_NAME = "gemini-2.5-flash-preview-04-17"
+SMALL_MODEL_NAME = "gemini-2.0-flash-lite"
+
 sessions: Dict[str, Dict[str, Any]] = {}
 
 
 class ChatBot:
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-preview-04-17", google_api_key=GEMINI_API_KEY)
-        self.embedding = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        self._llm = None
+        self._small_llm = None
+        self._llm_lock = threading.Lock()
+
+    @property
+    def llm(self):
+        with self._llm_lock:
+            if self._llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                self._llm = ChatGoogleGenerativeAI(model=MODEL_NAME, google_api_key=GEMINI_API_KEY, max_retries=1)
+        return self._llm
+
+    @property
+    def small_llm(self):
+        with self._llm_lock:
+            if self._small_llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                self._small_llm = ChatGoogleGenerativeAI(model=SMALL_MODEL_NAME, google_api_key=GEMINI_API_KEY, max_retries=1)
+        return self._small_llm
+
+    @property
+    def embedding(self):
+        return get_embedding_function()
     
     
-    def _get_history_for_session(self, session_id: str) -> BaseChatMessageHistory:
+    def _get_history_for_session(self, session_id: str) -> ChatHistory:
         if session_id not in sessions:
-            sessions[session_id] = {"history": ChatMessageHistory()}
+            sessions[session_id] = {"history": ChatHistory()}
         return sessions[session_id]["history"]
 
     def create_session(self, session_id: str, course_id: str) -> str:
@@ -56,7 +83,7 @@ class ChatBot:
             sessions[session_id] = {
                 "user": course_data['creator_username'],
                 "course": course_data['title'],
-                "history": ChatMessageHistory()
+                "history": ChatHistory()
             }
             return session_id
         except Exception as e:
@@ -71,24 +98,11 @@ class ChatBot:
             chunks_collection = mongo_db['chunks']
 
             client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-            vector_store = QdrantVectorStore(
-                client=client,
-                collection_name=COLLECTION_NAME,
-                embedding=self.embedding
-            )
-            qdrant_filter = Filter(
-                must=[
-                    FieldCondition(key="metadata.user", match=MatchValue(value=user)),
-                    FieldCondition(key="metadata.course", match=MatchValue(value=course))
-                ]
-            )
-            results = vector_store.similarity_search_with_score(query, filter=qdrant_filter, k=5)
-            
-            context = []
-            for doc, _ in results:
-                record = chunks_collection.find_one({"_id": doc.metadata['id']})
-                if record:
-                    context.append(record['chunk'])
+            points = search(client, query, user, course, limit=5)
+
+            chunk_ids = [point_chunk_id(point) for point in points]
+            records = fetch_chunks(chunks_collection, chunk_ids)
+            context = [records[chunk_id] for chunk_id in chunk_ids if chunk_id in records]
             return "\n\n".join(context)
         except Exception as e:
             print(f"Error retrieving context: {e}")
@@ -105,20 +119,33 @@ class ChatBot:
         if user is None or course is None:
             return None
 
+        start = time.perf_counter()
         history = sessions[session_id]["history"]
-        messages = history.messages.copy()
+        messages = history.recent_messages()
 
         messages.append(HumanMessage(content=message))
 
-        context = self._retrieve_context(message, user, course)
+        previous_context = sessions[session_id].get("context", "")
+        route = route_message(message, bool(previous_context))
+        if route == ROUTE_SMALL_TALK:
+            context = ""
+        elif route == ROUTE_FOLLOW_UP:
+            context = previous_context
+        else:
+            context = self._retrieve_context(message, user, course)
+            sessions[session_id]["context"] = context
+
         if context:
             context_msg = f"Context for this conversation:\n{context}\n\n"
             messages.insert(0, HumanMessage(content=context_msg))
 
-        response = self.llm.invoke(messages)
+        model_name, llm = (SMALL_MODEL_NAME, self.small_llm) if route == ROUTE_SMALL_TALK else (MODEL_NAME, self.llm)
+        response = gateway.call(model_name, lambda: llm.invoke(messages), lane=LANE_INTERACTIVE, owner=user)
+        usage = response.usage_metadata or {}
+        metrics.record_llm_call(model_name, usage.get('input_tokens'), usage.get('output_tokens'))
 
-        history.add_user_message(message)
-        history.add_ai_message(response.content)
+        history.add_turn(message, response.content)
+        metrics.record_chat_route(route, time.perf_counter() - start)
 
         return response.content
 
@@ -127,17 +154,19 @@ class ChatBot:
         history = sessions.get(session_id, {}).get("history", None)
         if history is None:
             return {'Human': [], 'AI': []}
+        return history.legacy()
 
-        human_messages = []
-        ai_messages = []
-
-        for msg in history.messages:
-            if msg.type == "human":
-                human_messages.append(msg.content)
-            elif msg.type == "ai":
-                ai_messages.append(msg.content)
+    def get_history_page(self, session_id: str, cursor: int = None, limit: int = CHAT_HISTORY_PAGE_SIZE) -> dict:
+        history = sessions.get(session_id, {}).get("history", None)
+        if history is None:
+            return None
+        return history.page(cursor, limit)
 
-        return {'Human': human_messages, 'AI': ai_messages}
+    def get_history_since(self, session_id: str, since: int, limit: int = CHAT_HISTORY_PAGE_SIZE) -> dict:
+        history = sessions.get(session_id, {}).get("history", None)
+        if history is None:
+            return None
+        return history.since(since, limit)
 
     def close_session(self, session_id: str) -> None:
         if session_id in sessions:
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+from typing import List, Dict, Set, Optional
+
+from tokenizer import count_tokens
+
+
+CONTEXT_PROMPT_TOKEN_BUDGET = int(os.getenv('CONTEXT_PROMPT_TOKEN_BUDGET', 16_000))
+CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', 0.7))
+CONTEXT_SKIP_SIBLING_CHUNKS = os.getenv('CONTEXT_SKIP_SIBLING_CHUNKS', 'true').lower() == 'true'
+CONTEXT_SEPARATOR = '\n\n---\n\n'
+
+
+def _mmr_order(hits: List[Dict], mmr_lambda: float) -> List[int]:
+    if not hits or any(hit.get('vector') is None for hit in hits):
+        return list(range(len(hits)))
+
+    vectors = np.array([hit['vector'] for hit in hits], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    relevance = np.array([hit['score'] for hit in hits], dtype=np.float32)
+    similarity = vectors @ vectors.T
+
+    order: List[int] = []
+    redundancy = np.zeros(len(hits), dtype=np.float32)
+    remaining = set(range(len(hits)))
+    while remaining:
+        candidates = sorted(remaining)
+        scores = mmr_lambda * relevance[candidates] - (1 - mmr_lambda) * redundancy[candidates]
+        best = candidates[int(np.argmax(scores))]
+        order.append(best)
+        remaining.remove(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+def pack_context(
+    hits: List[Dict],
+    token_budget: int,
+    baseline_k: int,
+    used_chunk_ids: Optional[Set[str]] = None,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA
+) -> Dict:
+    # hits are sorted by relevance and hold 'id', 'text', 'score' and optionally 'vector'.
+    used_chunk_ids = used_chunk_ids if used_chunk_ids is not None else set()
+    tokens = [count_tokens(hit['text']) for hit in hits]
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    baseline_tokens = sum(tokens[:baseline_k]) + separator_tokens * min(baseline_k, len(hits))
+
+    selected = []
+    packed_tokens = 0
+    skipped_siblings = 0
+    for i in _mmr_order(hits, mmr_lambda):
+        # A chunk another module already used is kept only when it is this module's best match.
+        if CONTEXT_SKIP_SIBLING_CHUNKS and hits[i]['id'] in used_chunk_ids and i != 0:
+            skipped_siblings += 1
+            continue
+        cost = tokens[i] + separator_tokens
+        if packed_tokens + cost > token_budget:
+            continue
+        selected.append(i)
+        packed_tokens += cost
+        if len(selected) == baseline_k:
+            break
+
+    used_chunk_ids.update(hits[i]['id'] for i in selected)
+    return {
+        'context': ''.join(CONTEXT_SEPARATOR + hits[i]['text'] for i in selected),
+        'chunk_ids': [hits[i]['id'] for i in selected],
+        'tokens': packed_tokens,
+        'baseline_tokens': baseline_tokens,
+        'tokens_saved': max(0, baseline_tokens - packed_tokens),
+        'skipped_sibling_chunks': skipped_siblings,
+    }
@@ -0,0 +1,130 @@
+import os
+from typing import List, Dict, Optional
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING
+
+
+load_dotenv()
+
+SEPARATE_QUESTION_BANKS = os.getenv('SEPARATE_QUESTION_BANKS', 'true').lower() == 'true'
+
+COURSES_COLLECTION = 'courses'
+MODULES_COLLECTION = 'course_modules'
+QUESTION_BANKS_COLLECTION = 'question_banks'
+
+OUTLINE_FIELDS = ['number', 'title', 'summary']
+QUESTION_BANK_FIELDS = ['questions', 'question_embeddings']
+STORAGE_VERSION = 2
+
+
+def ensure_indexes(mongo_db):
+    for collection_name in (MODULES_COLLECTION, QUESTION_BANKS_COLLECTION):
+        mongo_db[collection_name].create_index(
+            [('course_id', ASCENDING), ('module_number', ASCENDING)],
+            unique=True
+        )
+
+
+def number_modules(modules: List[Dict]) -> List[Dict]:
+    # Module numbers are the key of the module documents; missing or repeated ones are renumbered in order.
+    numbers = [module.get('number') for module in modules]
+    if None not in numbers and len(set(numbers)) == len(numbers):
+        return modules
+    return [{**module, 'number': number} for number, module in enumerate(modules, 1)]
+
+
+def insert_modules(mongo_db, course_id: str, modules: List[Dict]):
+    module_docs = []
+    question_bank_docs = []
+    for module in modules:
+        module_doc = {'course_id': course_id, 'module_number': module['number']}
+        question_bank_doc = {'course_id': course_id, 'module_number': module['number']}
+        for key, value in module.items():
+            if key == 'number':
+                continue
+            if SEPARATE_QUESTION_BANKS and key in QUESTION_BANK_FIELDS:
+                question_bank_doc[key] = value
+            else:
+                module_doc[key] = value
+        module_docs.append(module_doc)
+        if len(question_bank_doc) > 2:
+            question_bank_docs.append(question_bank_doc)
+
+    if module_docs:
+        mongo_db[MODULES_COLLECTION].insert_many(module_docs)
+    if question_bank_docs:
+        mongo_db[QUESTION_BANKS_COLLECTION].insert_many(question_bank_docs)
+
+
+def insert_course(mongo_db, course: Dict, modules: List[Dict]) -> str:
+    modules = number_modules(modules)
+    outline = [{field: module[field] for field in OUTLINE_FIELDS if field in module} for module in modules]
+    # Modules are written first so the course is published only once all of them are stored.
+    object_id = ObjectId()
+    course_id = str(object_id)
+    try:
+        insert_modules(mongo_db, course_id, modules)
+        mongo_db[COURSES_COLLECTION].insert_one({
+            **course,
+            '_id': object_id,
+            'modules': outline,
+            'storage_version': STORAGE_VERSION
+        })
+    except Exception:
+        delete_modules(mongo_db, course_id)
+        mongo_db[COURSES_COLLECTION].delete_one({'_id': object_id})
+        raise
+    return course_id
+
+
+def _find_legacy_modules(mongo_db, course_id: str, fields: List[str], module_number: Optional[int] = None) -> List[Dict]:
+    if not ObjectId.is_valid(course_id):
+        return []
+    projection = {'_id': 0, 'storage_version': 1, 'modules.number': 1, **{'modules.' + field: 1 for field in fields}}
+    course = mongo_db[COURSES_COLLECTION].find_one({'_id': ObjectId(course_id)}, projection)
+    # The outline kept in a migrated course has no content, so it must not be read as legacy modules.
+    if course is None or course.get('storage_version', 1) >= STORAGE_VERSION:
+        return []
+    modules = course.get('modules', [])
+    if module_number is not None:
+        modules = [module for module in modules if module.get('number') == module_number]
+    return modules
+
+
+def find_modules(mongo_db, course_id: str, fields: List[str], module_number: Optional[int] = None) -> List[Dict]:
+    bank_fields = [field for field in fields if SEPARATE_QUESTION_BANKS and field in QUESTION_BANK_FIELDS]
+    module_fields = [field for field in fields if field not in bank_fields]
+
+    query = {'course_id': course_id}
+    if module_number is not None:
+        query['module_number'] = module_number
+
+    modules = {}
+    projection = {'_id': 0, 'module_number': 1, **{field: 1 for field in module_fields}}
+    for doc in mongo_db[MODULES_COLLECTION].find(query, projection):
+        number = doc.pop('module_number')
+        modules[number] = {'number': number, **doc}
+
+    if not modules:
+        # Course was stored before modules got their own collection and is not migrated yet.
+        return _find_legacy_modules(mongo_db, course_id, fields, module_number)
+
+    if bank_fields:
+        projection = {'_id': 0, 'module_number': 1, **{field: 1 for field in bank_fields}}
+        for doc in mongo_db[QUESTION_BANKS_COLLECTION].find(query, projection):
+            number = doc.pop('module_number')
+            if number in modules:
+                modules[number].update(doc)
+
+    return [modules[key] for key in sorted(modules)]
+
+
+def find_module(mongo_db, course_id: str, module_number: int, fields: List[str]) -> Optional[Dict]:
+    modules = find_modules(mongo_db, course_id, fields, module_number)
+    return modules[0] if modules else None
+
+
+def delete_modules(mongo_db, course_id: str):
+    mongo_db[MODULES_COLLECTION].delete_many({'course_id': course_id})
+    mongo_db[QUESTION_BANKS_COLLECTION].delete_many({'course_id': course_id})
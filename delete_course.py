@@ -4,6 +4,9 @@ from qdrant_client import QdrantClient
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue
 from pymongo import MongoClient
 
+from course_store import delete_modules
+from question_pool import delete_course_pool
+
 
 load_dotenv()
 
@@ -33,6 +36,10 @@ def delete_course(user: str, course: str):
         mongo_db = mongo_client['edtech']
 
         course_collection = mongo_db['courses']
+        course_data = course_collection.find_one({'creator_username': user, 'title': course}, {'_id': 1})
+        if course_data is not None:
+            delete_modules(mongo_db, str(course_data['_id']))
+            delete_course_pool(mongo_db, str(course_data['_id']))
         course_collection.delete_one({'creator_username': user, 'title': course})
 
         chunks_collection = mongo_db['chunks']
@@ -0,0 +1,71 @@
+import os
+import threading
+from typing import List, Dict, Optional
+
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# "torch" runs the model with PyTorch, "onnx" and "onnx-int8" run the exported
+# (and int8-quantized) weights of the same model with ONNX Runtime.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+ONNX_FILE_NAMES: Dict[str, str] = {
+    'onnx': os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model.onnx'),
+    'onnx-int8': os.getenv('EMBEDDING_ONNX_INT8_FILE', 'onnx/model_quint8_avx2.onnx'),
+}
+EMBEDDING_BACKENDS = ['torch'] + list(ONNX_FILE_NAMES)
+EMBEDDING_PARITY_THRESHOLD = float(os.getenv('EMBEDDING_PARITY_THRESHOLD', 0.99))
+
+_embedding = None
+_lock = threading.Lock()
+
+
+def create_embedding_function(backend: str = EMBEDDING_BACKEND):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend not in EMBEDDING_BACKENDS:
+        print(f"Warning: unknown embedding backend '{backend}', using torch.")
+        backend = 'torch'
+    if backend == 'torch':
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'backend': 'onnx', 'model_kwargs': {'file_name': ONNX_FILE_NAMES[backend]}}
+    )
+
+
+def get_embedding_function():
+    global _embedding
+    with _lock:
+        if _embedding is None:
+            _embedding = create_embedding_function()
+    return _embedding
+
+
+def parity_check(
+    texts: List[str],
+    backend: str,
+    reference: str = 'torch',
+    threshold: float = EMBEDDING_PARITY_THRESHOLD,
+    reference_vectors: Optional[List[List[float]]] = None
+) -> Dict:
+    # Vectors already stored in Qdrant were made by the reference backend, so a new
+    # backend is only safe when it points every text in (almost) the same direction.
+    import numpy as np
+
+    if reference_vectors is None:
+        reference_vectors = create_embedding_function(reference).embed_documents(texts)
+    vectors = np.array(create_embedding_function(backend).embed_documents(texts), dtype=np.float32)
+    reference_vectors = np.array(reference_vectors, dtype=np.float32)
+
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    reference_vectors /= np.linalg.norm(reference_vectors, axis=1, keepdims=True) + 1e-12
+    cosines = (vectors * reference_vectors).sum(axis=1)
+    return {
+        'backend': backend,
+        'reference': reference,
+        'texts': len(texts),
+        'min_cosine': round(float(cosines.min()), 5),
+        'mean_cosine': round(float(cosines.mean()), 5),
+        'threshold': threshold,
+        'passed': bool(cosines.min() >= threshold),
+    }
@@ -1,19 +1,30 @@
 import os
 import re
+import json
+import time
+import queue
+import threading
+from io import BytesIO
 from enum import Enum
+from contextlib import contextmanager
 from uuid import uuid4
 from dotenv import load_dotenv
-from typing import List, Dict, Tuple
-from google import genai
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import List, Dict, Callable, Optional, Iterator, Iterable, Any
 from langchain.schema.document import Document
 from langchain.prompts import ChatPromptTemplate
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-from unstructured.partition.pdf import partition_pdf
 from pymongo import MongoClient
-import tiktoken
+
+import metrics
+from embeddings import get_embedding_function
+from tokenizer import count_tokens
+from llm_gateway import gateway, llm_priority, LANE_BATCH
+from quiz_selection import embed_questions
+from course_store import ensure_indexes, insert_course
+from context_packing import pack_context, CONTEXT_PROMPT_TOKEN_BUDGET
+from retrieval import search_batch, fetch_chunks, point_chunk_id, course_filter
+from table_format import serialize_table, TABLE_FORMAT
 
 
 load_dotenv()
@@ -24,30 +35,70 @@ QDRANT_URL = os.getenv('QDRANT_URL')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
 QDRANT_API_KEY = os.getenv('QDRANT_API_KEY')
 COLLECTION_NAME = os.getenv('COLLECTION_NAME')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
 MODEL_NAME = "gemini-2.5-flash-preview-04-17"
 SMALL_MODEL_NAME = "gemini-2.0-flash-lite"
 CONTEXT_WINDOW_THRESHOLD = 100_000
-
-client = genai.Client(api_key=GEMINI_API_KEY)
+MODULE_QUESTION_NUM = 20
+QUESTION_OUTPUT_MODE = os.getenv('QUESTION_OUTPUT_MODE', 'json')
+QUESTION_TOP_UP_ROUNDS = int(os.getenv('QUESTION_TOP_UP_ROUNDS', 2))
+
+# Parsing, summarization and storage run as a streaming pipeline connected by bounded queues.
+INGEST_PAGE_WINDOW = int(os.getenv('INGEST_PAGE_WINDOW', 10))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 16))
+INGEST_SUMMARIZE_WORKERS = int(os.getenv('INGEST_SUMMARIZE_WORKERS', 4))
+INGEST_STORE_BATCH_SIZE = int(os.getenv('INGEST_STORE_BATCH_SIZE', 16))
+QUEUE_POLL_SECONDS = 0.5
+
+# "packed" summarizes several chunks in one request up to the token budget, "single" makes one request per chunk.
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'packed')
+SUMMARY_PACK_TOKEN_BUDGET = int(os.getenv('SUMMARY_PACK_TOKEN_BUDGET', 8000))
+SUMMARY_PACK_MAX_CHUNKS = int(os.getenv('SUMMARY_PACK_MAX_CHUNKS', 8))
+_DONE = object()
+
+OPTION_KEYS = ['a', 'b', 'c', 'd']
+QUESTION_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'question': {'type': 'STRING'},
+            'options': {
+                'type': 'OBJECT',
+                'properties': {key: {'type': 'STRING'} for key in OPTION_KEYS},
+                'required': OPTION_KEYS
+            },
+            'answer': {'type': 'STRING', 'enum': OPTION_KEYS}
+        },
+        'required': ['question', 'options', 'answer']
+    }
+}
+QUESTION_TEXT_FORMAT = (
+    "Format:\n"
+    "1. [Question text]\n"
+    "a) [Option A]\n"
+    "b) [Option B]\n"
+    "c) [Option C]\n"
+    "d) [Option D]\n"
+    "Answer: [a/b/c/d]\n\n"
+    "2. [Question text]\n"
+    "a) [Option A]\n"
+    "b) [Option B]\n"
+    "c) [Option C]\n"
+    "d) [Option D]\n"
+    "Answer: [a/b/c/d]\n\n"
+)
+QUESTION_JSON_FORMAT = (
+    "Format:\n"
+    "Return a JSON array. Each item has \"question\", \"options\" with keys \"a\", \"b\", \"c\", \"d\", "
+    "and \"answer\" with the key of the correct option.\n\n"
+)
 
 def get_small_model_response(content: str) -> str:
-    response = client.models.generate_content(
-        model=SMALL_MODEL_NAME,
-        contents=content
-    )
-    return response.text
+    return gateway.generate(SMALL_MODEL_NAME, content)
 
 def get_model_response(content: str) -> str:
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=content
-    )
-    return response.text
-
-def get_embedding_function():
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    return gateway.generate(MODEL_NAME, content)
 
 
 class CourseStatus(str, Enum):
@@ -62,14 +113,13 @@ def store_course(modules: List[Dict], course_summary: str, user: str, course: st
     try:
         mongo_client = MongoClient(MONGO_URI)
         mongo_db = mongo_client[MONGO_DB_NAME]
-        course_collection = mongo_db['courses']
-        course_collection.insert_one({
+        ensure_indexes(mongo_db)
+        insert_course(mongo_db, {
             'title': course,
             'creator_username': user,
             'description': course_summary,
-            'modules': modules,
             'status': CourseStatus.PRIVATE
-        })
+        }, modules)
     except Exception as e:
         print('Error: cannot insert course data in a database:', e)
     finally:
@@ -106,35 +156,95 @@ def parse_questions(question_text: str) -> List[Dict]:
         })
     return questions
 
+def question_format() -> str:
+    return QUESTION_JSON_FORMAT if QUESTION_OUTPUT_MODE == 'json' else QUESTION_TEXT_FORMAT
+
+def validate_question(question) -> Optional[Dict]:
+    if not isinstance(question, dict) or not isinstance(question.get('options'), dict):
+        return None
+
+    text = question.get('question')
+    options = {str(key).strip().lower().rstrip(')'): value for key, value in question['options'].items()}
+    answer = str(question.get('answer', '')).strip().lower().rstrip(')')
+    if not isinstance(text, str) or not text.strip() or answer not in OPTION_KEYS:
+        return None
+    if any(not isinstance(options.get(key), str) or not options[key].strip() for key in OPTION_KEYS):
+        return None
+    if len({options[key].strip().lower() for key in OPTION_KEYS}) < len(OPTION_KEYS):
+        return None
+
+    return {
+        'question': text.strip(),
+        'options': {key: options[key].strip() for key in OPTION_KEYS},
+        'answer': answer
+    }
+
+def parse_structured_questions(text: str) -> List[Dict]:
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        return parse_questions(text or '')
+    if isinstance(data, dict):
+        data = data.get('questions', [])
+    return data if isinstance(data, list) else []
+
+def request_questions(prompt: str, model: str) -> List[Dict]:
+    if QUESTION_OUTPUT_MODE == 'json':
+        response = gateway.generate(
+            model,
+            prompt,
+            config={'response_mime_type': 'application/json', 'response_schema': QUESTION_SCHEMA}
+        )
+        return parse_structured_questions(response)
+    return parse_questions(gateway.generate(model, prompt))
+
+def generate_question_set(build_prompt: Callable[[int], str], question_num: int, model: str = SMALL_MODEL_NAME) -> List[Dict]:
+    questions = []
+    seen = set()
+    for _ in range(QUESTION_TOP_UP_ROUNDS + 1):
+        missing = question_num - len(questions)
+        if missing <= 0:
+            break
+
+        prompt = build_prompt(missing)
+        if questions:
+            # Top-up round: only ask for the missing questions and show what already exists.
+            prompt += (
+                "\n\n* Already generated questions (do not repeat them): *\n"
+                + '\n'.join(f"- {question['question']}" for question in questions)
+            )
+
+        for question in request_questions(prompt, model):
+            question = validate_question(question)
+            if question is None or question['question'].lower() in seen:
+                continue
+            seen.add(question['question'].lower())
+            questions.append(question)
+            if len(questions) == question_num:
+                break
+    return questions
+
 def generate_questions(course_content: List[Dict]) -> List[Dict]:
     prompt_text = (
         "You are an AI assistant tasked with generating multiple-choice questions (MCQs) "
         "to assess understanding of the provided module content.\n\n"
         "Instructions:\n"
-        "- Generate about 20 MCQs based on the module content.\n"
+        "- Generate exactly {question_num} MCQs based on the module content.\n"
         "- Each question should have four options labeled a), b), c), and d).\n"
         "- Only one option should be correct.\n"
         "- Provide the correct answer after each question.\n"
         "- Questions can be paraphrased or have similarities.\n\n"
-        "Format:\n"
-        "1. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
-        "2. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
+        "{format}"
         "Module Content:\n"
     )
+    embedding = get_embedding_function()
     for module in course_content:
-        response = get_small_model_response(prompt_text + module['content'])
-        questions = parse_questions(response)
+        questions = generate_question_set(
+            lambda question_num: prompt_text.format(question_num=question_num, format=question_format()) + module['content'],
+            MODULE_QUESTION_NUM
+        )
         module['questions'] = questions
+        module['question_embeddings'] = embed_questions(questions, embedding)
     
     return course_content
 
@@ -174,29 +284,37 @@ def generate_course_content(toc: List[Dict], user: str, course: str, k: int = 10
         chunks_collection = mongo_db['chunks']
 
         client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-        vector_db = QdrantVectorStore(client=client, collection_name=COLLECTION_NAME, embedding=get_embedding_function())
-        filter = Filter(
-            must=[
-                FieldCondition(key="metadata.user", match=MatchValue(value=user)),
-                FieldCondition(key="metadata.course", match=MatchValue(value=course))
-            ]
-        )
         toc_text = ''
         for module in toc:
             toc_text += f"{module['number']}. {module['title']}\nSummary: {module['summary']}\n\n"
 
-        for module in toc:
-            results = vector_db.similarity_search_with_score(module['summary'], filter=filter, k=k)
-            context = ''
-            for doc, _ in results:
-                record = chunks_collection.find_one({"_id": doc.metadata['id']})
-                if record:
-                    context += '\n\n---\n\n' + record['chunk']
-
-            prompt = ChatPromptTemplate.from_template(prompt_template).format(
+        # Fetch extra candidates so the packer can trade redundant chunks for diverse ones.
+        module_points = search_batch(
+            client, [module['summary'] for module in toc], user, course, limit=k * 2, with_vectors=True
+        )
+        records = fetch_chunks(
+            chunks_collection,
+            list({point_chunk_id(point) for points in module_points for point in points})
+        )
+
+        template = ChatPromptTemplate.from_template(prompt_template)
+        used_chunk_ids = set()
+        for module, points in zip(toc, module_points):
+            hits = [
+                {'id': point_chunk_id(point), 'text': records[point_chunk_id(point)], 'score': point.score, 'vector': point.vector}
+                for point in points if point_chunk_id(point) in records
+            ]
+
+            token_budget = CONTEXT_PROMPT_TOKEN_BUDGET - count_tokens(
+                template.format(toc=toc_text, summary=module['summary'], context='')
+            )
+            packed = pack_context(hits, max(0, token_budget), k, used_chunk_ids)
+            metrics.record_context_packing(packed['tokens'], packed['tokens_saved'])
+
+            prompt = template.format(
                 toc=toc_text,
                 summary=module['summary'],
-                context=context
+                context=packed['context']
             )
             response = get_model_response(prompt)
             module['content'] = response
@@ -264,12 +382,11 @@ def get_files_summary(chunks_summaries: List[str]) -> str:
     Just give the summary as it is.
 
     Text chunk:\n"""
-    encoding = tiktoken.get_encoding('cl100k_base')
-    
+
     def recursive_summary(summaries: List[str]) -> str:
         token_num = 0
         for summary in summaries:
-            token_num += len(encoding.encode(summary))
+            token_num += count_tokens(summary)
         
         if token_num < CONTEXT_WINDOW_THRESHOLD:
             return '\n'.join(summaries)
@@ -312,23 +429,29 @@ def generate_toc(chunks_summaries: List[str], module_num: int) -> List[Dict]:
     return parse_module_summaries(response)
 
 
+def course_exists(user: str, course: str) -> bool:
+    try:
+        client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+        count_result = client.count(collection_name=COLLECTION_NAME, count_filter=course_filter(user, course))
+        return count_result.count > 0
+    except Exception as e:
+        print('Error: cannot check whether the course exists:', e)
+        return False
+    finally:
+        client.close()
+
+
 def store_chunks(chunks: List[str], chunks_summaries: List[str], user: str, course: str):
-    ids = []
+    ids = [str(uuid4()) for _ in chunks]
     
     try:
         mongo_client = MongoClient(MONGO_URI)
         db = mongo_client[MONGO_DB_NAME]
         chunks_collection = db['chunks']
-        
-        for chunk in chunks:
-            id = str(uuid4())
-            chunks_collection.insert_one({
-                "_id": id,
-                "user": user,
-                "course": course,
-                "chunk": chunk
-            })
-            ids.append(id)
+        chunks_collection.insert_many([
+            {"_id": id, "user": user, "course": course, "chunk": chunk}
+            for id, chunk in zip(ids, chunks)
+        ])
     except Exception as e:
         print('Error: cannot insert chunks into "chunks_actual_texts" collection:', e)
     finally:
@@ -338,17 +461,6 @@ def store_chunks(chunks: List[str], chunks_summaries: List[str], user: str, cour
         client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
         db = QdrantVectorStore(client=client, collection_name=COLLECTION_NAME, embedding=get_embedding_function())
 
-        qdrant_filter = Filter(
-            must=[
-                FieldCondition(key="metadata.user", match=MatchValue(value=user)),
-                FieldCondition(key="metadata.course", match=MatchValue(value=course))
-            ]
-        )
-        count_result = client.count(collection_name=COLLECTION_NAME, count_filter=qdrant_filter)
-        if count_result.count > 0:
-            print(f"Course with the name '{course}' already exists.")
-            exit()
-
         docs = []
         for i in range(len(chunks_summaries)):
             docs.append(Document(
@@ -362,7 +474,20 @@ def store_chunks(chunks: List[str], chunks_summaries: List[str], user: str, cour
         client.close()
 
 
-def summarize_chunks(chunks: List[str]) -> List[str]:
+def pack_by_tokens(items: Iterable, count: Callable[[Any], int], token_budget: int, max_items: int) -> Iterator[List]:
+    pack, pack_tokens = [], 0
+    for item in items:
+        tokens = count(item)
+        if pack and (pack_tokens + tokens > token_budget or len(pack) >= max_items):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append(item)
+        pack_tokens += tokens
+    if pack:
+        yield pack
+
+
+def summarize_chunk(text: str) -> str:
     prompt_text = """
     You are an assistant tasked with summarizing text.
     Give a concise summary of the text.
@@ -372,71 +497,265 @@ def summarize_chunks(chunks: List[str]) -> List[str]:
     Just give the summary as it is.
 
     Text chunk:\n"""
-    chunks_summaries = [get_small_model_response(prompt_text + text) for text in chunks]
+    return get_small_model_response(prompt_text + text)
+
+
+def summarize_chunk_pack(chunks: List[str]) -> List[Optional[str]]:
+    prompt_text = """
+    You are an assistant tasked with summarizing text.
+    Give a concise summary of each text chunk below. Every chunk starts with <chunk id="N"> and ends with </chunk>.
+
+    Respond only with the summaries, one for every chunk, in this format:
+    <summary id="N">summary of chunk N</summary>
+    Do not add any other comment.
+    Do not start a summary by saying "Here is a summary" or anything like that.
+
+    Text chunks:\n"""
+    prompt_text += ''.join(f'<chunk id="{i}">\n{text}\n</chunk>\n' for i, text in enumerate(chunks, 1))
+    response = get_small_model_response(prompt_text)
+
+    summaries: List[Optional[str]] = [None] * len(chunks)
+    for id, summary in re.findall(r'<summary id="(\d+)">(.*?)</summary>', response, re.DOTALL):
+        index = int(id) - 1
+        if 0 <= index < len(chunks) and summary.strip():
+            summaries[index] = summary.strip()
+    return summaries
+
+
+def summarize_chunks(chunks: List[str]) -> List[str]:
+    max_chunks = SUMMARY_PACK_MAX_CHUNKS if SUMMARY_MODE == 'packed' else 1
+    chunks_summaries = []
+    for pack in pack_by_tokens(chunks, count_tokens, SUMMARY_PACK_TOKEN_BUDGET, max_chunks):
+        if len(pack) == 1:
+            chunks_summaries.append(summarize_chunk(pack[0]))
+            continue
+
+        summaries = summarize_chunk_pack(pack)
+        # A chunk the packed answer left out is summarized on its own.
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        metrics.record_summary_fallbacks(len(missing))
+        for i in missing:
+            summaries[i] = summarize_chunk(pack[i])
+        chunks_summaries += summaries
     return chunks_summaries
 
 
-def parse_files(files_paths: List[str]) -> Tuple[List[str], int]:
+def partition_file(file_path: str) -> Iterator:
+    from unstructured.partition.pdf import partition_pdf
+
+    partition_kwargs = dict(
+        infer_table_structure=True,
+        strategy='hi_res',
+        chunking_strategy='by_title',
+        max_characters=10000,
+        combine_text_under_n_chars=2000,
+        new_after_n_chars=6000)
+
+    if INGEST_PAGE_WINDOW <= 0:
+        yield from partition_pdf(filename=file_path, **partition_kwargs)
+        return
+
+    # Partitioning a few pages at a time lets the first chunks move on before the whole file is parsed.
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(file_path)
+    for first_page in range(0, len(reader.pages), INGEST_PAGE_WINDOW):
+        writer = PdfWriter()
+        for page in reader.pages[first_page:first_page + INGEST_PAGE_WINDOW]:
+            writer.add_page(page)
+        window = BytesIO()
+        writer.write(window)
+        window.seek(0)
+        yield from partition_pdf(
+            file=window,
+            metadata_filename=file_path,
+            starting_page_number=first_page + 1,
+            **partition_kwargs)
+
+
+def table_to_text(html: str) -> str:
+    table = serialize_table(html) or html
+    if TABLE_FORMAT != 'html':
+        metrics.record_table_tokens(count_tokens(html), count_tokens(table))
+    return table
+
+
+def chunk_to_text(chunk) -> str:
+    text = ''
+    for element in chunk.metadata.orig_elements:
+        if 'Image' in str(type(element)):
+            continue
+        elif 'Table' in str(type(element)):
+            text += table_to_text(element.metadata.text_as_html) + '\n'
+        else:
+            text += element.text + '\n'
+    return text
+
+
+def iter_file_chunks(files_paths: List[str]) -> Iterator[str]:
+    for file_path in files_paths:
+        for chunk in partition_file(file_path):
+            yield chunk_to_text(chunk)
+
+
+def get_module_num(token_num: int) -> int:
+    return min(int((token_num / 1000)**0.5) + 2, 30)
+
+
+def _put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocks while the queue is full, which is what keeps the pipeline's memory bounded.
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def ingest_files(files_paths: List[str], user: str, course: str, stats: metrics.StageStats):
+    # Yields progress events while chunks stream through and returns (chunks_summaries, module_num),
+    # so it is used with "yield from".
     if len(files_paths) == 0:
         print('there is no files.')
         return [], 0
-    
-    chunks = []
-    for file_path in files_paths:
-        chunks += partition_pdf(
-            filename=file_path,
-            infer_table_structure=True,
-            strategy='hi_res',
-            chunking_strategy='by_title',
-            max_characters=10000,
-            combine_text_under_n_chars=2000,
-            new_after_n_chars=6000)
-    
-    encoding = tiktoken.get_encoding('cl100k_base')
-    token_num = 0
-    texts = []
-    for chunk in chunks:
-        text = ''
-        for element in chunk.metadata.orig_elements:
-            if 'Image' in str(type(element)):
-                continue
-            elif 'Table' in str(type(element)):
-                text += element.metadata.text_as_html + '\n'
-            else:
-                text += element.text + '\n'
-        token_num += len(encoding.encode(text))
-        texts.append(text)
-    
-    module_num = min(int((token_num / 1000)**0.5) + 2, 30)
-    return texts, module_num
 
+    chunk_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    summary_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stop = threading.Event()
+    errors: List[Exception] = []
+    parsing = {'done': False, 'token_num': 0}
+
+    def counted_chunks():
+        for index, text in enumerate(iter_file_chunks(files_paths)):
+            tokens = count_tokens(text)
+            parsing['token_num'] += tokens
+            yield index, text, tokens
+
+    def parse():
+        # Consecutive chunks are queued as packs that summarize_chunks sends in one request.
+        max_chunks = SUMMARY_PACK_MAX_CHUNKS if SUMMARY_MODE == 'packed' else 1
+        try:
+            for pack in pack_by_tokens(counted_chunks(), lambda item: item[2], SUMMARY_PACK_TOKEN_BUDGET, max_chunks):
+                if not _put(chunk_queue, [(index, text) for index, text, _ in pack], stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            parsing['done'] = True
+            for _ in range(INGEST_SUMMARIZE_WORKERS):
+                _put(chunk_queue, _DONE, stop)
+
+    def summarize():
+        try:
+            while not stop.is_set():
+                try:
+                    item = chunk_queue.get(timeout=QUEUE_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                summaries = summarize_chunks([text for _, text in item])
+                for (index, text), summary in zip(item, summaries):
+                    if not _put(summary_queue, (index, text, summary), stop):
+                        return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(summary_queue, _DONE, stop)
+
+    start = time.perf_counter()
+    with metrics.use(stats), llm_priority(LANE_BATCH, user):
+        metrics.start_thread(parse, name='ingest-parse')
+        for i in range(INGEST_SUMMARIZE_WORKERS):
+            metrics.start_thread(summarize, name=f'ingest-summarize-{i}')
+
+    # Only summaries are kept for the table of contents; chunk texts are dropped once they are stored.
+    chunks_summaries: Dict[int, str] = {}
+    batch = []
+    running_workers = INGEST_SUMMARIZE_WORKERS
+    loaded_reported = False
+    try:
+        while running_workers > 0:
+            try:
+                item = summary_queue.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                item = None
+            if errors:
+                raise errors[0]
+            if item is _DONE:
+                running_workers -= 1
+            elif item is not None:
+                batch.append(item)
+
+            # Store a batch when it is full, when the summarizers are idle or when the stream ends.
+            if batch and (len(batch) >= INGEST_STORE_BATCH_SIZE or item is None or running_workers == 0):
+                with metrics.use(stats):
+                    store_chunks([text for _, text, _ in batch], [summary for _, _, summary in batch], user, course)
+                for index, _, summary in batch:
+                    chunks_summaries[index] = summary
+                batch = []
+                elapsed = time.perf_counter() - start
+                yield {'data': f'{len(chunks_summaries)} chunks are summarized and saved '
+                               f'({len(chunks_summaries) / elapsed:.2f} chunks/s).'}
+
+            if parsing['done'] and not loaded_reported:
+                loaded_reported = True
+                yield {'data': 'Files are loaded.'}
+                tables = stats.to_dict()
+                if tables.get('table_tokens_html'):
+                    yield {'data': f"Tables take {tables['table_tokens']} tokens as {TABLE_FORMAT} "
+                                   f"instead of {tables['table_tokens_html']} tokens as HTML."}
+    finally:
+        stop.set()
+
+    if errors:
+        raise errors[0]
+    return [chunks_summaries[index] for index in sorted(chunks_summaries)], get_module_num(parsing['token_num'])
 
-def generate_course(user: str, course: str, files_paths: List[str]):
-    yield {'data': 'Course generation is started...'}
-    
-    chunks, module_num = parse_files(files_paths)
-    yield {'data': 'Files are loaded.'}
 
-    chunks_summaries = summarize_chunks(chunks)
-    yield {'data': 'Chunks are summarized.'}
+@contextmanager
+def course_stage(stage: str, user: str, course_stats: metrics.StageStats):
+    with metrics.track(stage, course_stats) as stats, llm_priority(LANE_BATCH, user):
+        yield stats
 
-    store_chunks(chunks, chunks_summaries, user, course)
-    yield {'data': 'Chunks saved in a database.'}
+def generate_course(user: str, course: str, files_paths: List[str]):
+    yield {'data': 'Course generation is started...'}
+    course_stats = metrics.StageStats('generate_course')
+
+    if course_exists(user, course):
+        print(f"Course with the name '{course}' already exists.")
+        yield {'data': f"Course with the name '{course}' already exists."}
+        return
+
+    # The stage spans several yields, so it is timed here rather than with course_stage.
+    stats = metrics.StageStats('ingest_files')
+    start = time.perf_counter()
+    chunks_summaries, module_num = yield from ingest_files(files_paths, user, course, stats)
+    metrics.finish(stats, time.perf_counter() - start, course_stats)
+    yield from metrics.progress_events('Chunks are summarized and saved in a database.', stats)
     
-    toc = generate_toc(chunks_summaries, module_num)
-    yield {'data': 'Table of contents is generated.'}
+    with course_stage('generate_toc', user, course_stats) as stats:
+        toc = generate_toc(chunks_summaries, module_num)
+    yield from metrics.progress_events('Table of contents is generated.', stats)
 
-    course_summary = generate_course_summary(toc)
-    yield {'data': 'Summary of course is generated.'}
+    with course_stage('generate_course_summary', user, course_stats) as stats:
+        course_summary = generate_course_summary(toc)
+    yield from metrics.progress_events('Summary of course is generated.', stats)
 
-    course_content = generate_course_content(toc, user, course)
-    yield {'data': 'Content of the course is generated.'}
+    with course_stage('generate_course_content', user, course_stats) as stats:
+        course_content = generate_course_content(toc, user, course)
+    yield from metrics.progress_events('Content of the course is generated.', stats)
 
-    course_content = generate_questions(course_content)
-    yield {'data': 'Questions of the course are generated.'}
+    with course_stage('generate_questions', user, course_stats) as stats:
+        course_content = generate_questions(course_content)
+    yield from metrics.progress_events('Questions of the course are generated.', stats)
     
-    store_course(course_content, course_summary, user, course)
-    yield {'data': 'Course are successfuly generated.'}
+    with course_stage('store_course', user, course_stats) as stats:
+        store_course(course_content, course_summary, user, course)
+    yield from metrics.progress_events('Course are successfuly generated.', course_stats)
 
 
 if __name__ == '__main__':
@@ -1,30 +1,55 @@
 import os
+import re
+import threading
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from bson import ObjectId
-from typing import List, Dict
-from google import genai
+from typing import List, Dict, Optional, Tuple
 from langchain.prompts import ChatPromptTemplate
 from pymongo import MongoClient
-from random import randint
+from random import sample
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from generate_course import parse_questions
+import metrics
+from llm_gateway import gateway, llm_priority, LANE_QUIZ, LANE_BATCH
+from generate_course import generate_question_set, question_format
+from embeddings import get_embedding_function
+from course_store import find_module, find_modules
+from quiz_selection import embed_questions, select_related_questions
+from question_pool import (
+    FINAL_QUIZ_POOL,
+    mistake_signature,
+    unseen,
+    ensure_indexes as ensure_pool_indexes,
+    take_questions as take_pool_questions,
+    seen_questions as seen_pool_questions,
+    add_questions as add_pool_questions
+)
 
 load_dotenv()
 
 
 MONGO_URI = os.getenv('MONGO_URI')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
 MODEL_NAME = "gemini-2.5-flash-preview-04-17"
+MODULE_QUIZ_SELECTION = os.getenv('MODULE_QUIZ_SELECTION', 'embedding')
+MODULE_QUIZ_SIZE = 10
+FINAL_QUIZ_CONCURRENCY = int(os.getenv('FINAL_QUIZ_CONCURRENCY', 4))
+
+# The follow-up quiz of an attempt is built in the background as soon as the attempt is recorded.
+PREGENERATE_MODULE_QUIZZES = os.getenv('PREGENERATE_MODULE_QUIZZES', 'true').lower() == 'true'
+PREGENERATION_WORKERS = int(os.getenv('PREGENERATION_WORKERS', 2))
+PREGENERATION_WAIT_SECONDS = float(os.getenv('PREGENERATION_WAIT_SECONDS', 60))
+PREGENERATION_WATCH_RETRY_SECONDS = float(os.getenv('PREGENERATION_WATCH_RETRY_SECONDS', 30))
+PREGENERATED_QUIZ_TTL_SECONDS = int(os.getenv('PREGENERATED_QUIZ_TTL_SECONDS', 7 * 24 * 3600))
+
+_pregeneration_executor = ThreadPoolExecutor(max_workers=max(1, PREGENERATION_WORKERS), thread_name_prefix='quiz-pregeneration')
+_pregenerations: Dict[str, Future] = {}
+_pregeneration_lock = threading.Lock()
 
 def get_model_response(content: str) -> str:
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=content
-    )
-    return response.text
+    return gateway.generate(MODEL_NAME, content)
 
 
 def save_quiz(question_ids: List[int], quiz_attempt: Dict) -> str:
@@ -46,7 +71,7 @@ def save_quiz(question_ids: List[int], quiz_attempt: Dict) -> str:
     finally:
         mongo_client.close()
 
-def generate_module_quiz(attempt_id: str):
+def select_questions_with_llm(questions_db: List[Dict], incorrecty_answered_question_ids: List[int]) -> List[int]:
     prompt_template = (
         "You are an intelligent assistant tasked with generating a personalized quiz to help reduce a user's knowledge gaps.\n"
         "Based on the list of questions the user answered incorrectly, select **exactly 10 related questions** from the provided database.\n"
@@ -59,7 +84,62 @@ def generate_module_quiz(attempt_id: str):
         "* User's incorrectly answered questions: *\n{incorrecty_answered_questions}\n"
         "* Available questions in the database: *\n{questions}"
     )
-    questions_db = []
+    incorrecty_answered_questions_text = ''
+    for question_id in incorrecty_answered_question_ids:
+        question_text = str(question_id+1) + '. ' + questions_db[question_id]['question'] + '\n'
+        option_text = '\n'.join(key + ') ' + value for key, value in questions_db[question_id]['options'].items())
+        incorrecty_answered_questions_text += question_text + option_text + '\n\n'
+    
+    question_db_text = ''
+    for i, question in enumerate(questions_db, 1):
+        question_text = str(i) + '. ' + question['question'] + '\n'
+        option_text = '\n'.join(key + ') ' + value for key, value in question['options'].items())
+        question_db_text += question_text + option_text + '\n\n'
+    
+    prompt = ChatPromptTemplate.from_template(prompt_template).format(
+        incorrecty_answered_questions=incorrecty_answered_questions_text,
+        questions=question_db_text,
+    )
+    response = get_model_response(prompt)
+
+    result = []
+    for num in re.findall(r'\d+', response):
+        question_id = int(num) - 1
+        if 0 <= question_id < len(questions_db) and question_id not in result:
+            result.append(question_id)
+    return sorted(result[:MODULE_QUIZ_SIZE])
+
+def select_questions(module: Dict, incorrecty_answered_question_ids: List[int]) -> List[int]:
+    questions_db = module['questions']
+    if MODULE_QUIZ_SELECTION == 'llm':
+        return select_questions_with_llm(questions_db, incorrecty_answered_question_ids)
+
+    try:
+        question_embeddings = module.get('question_embeddings')
+        if not question_embeddings or len(question_embeddings) != len(questions_db):
+            question_embeddings = embed_questions(questions_db, get_embedding_function())
+        return select_related_questions(question_embeddings, incorrecty_answered_question_ids, k=MODULE_QUIZ_SIZE)
+    except Exception as e:
+        print('Error: cannot select related questions by embeddings, falling back to LLM.', e)
+        return select_questions_with_llm(questions_db, incorrecty_answered_question_ids)
+
+def generate_module_quiz(attempt_id: str):
+    with llm_priority(LANE_QUIZ):
+        return _generate_module_quiz(attempt_id)
+
+def _generate_module_quiz(attempt_id: str):
+    pregenerated_quiz = take_pregenerated_quiz(attempt_id)
+    if pregenerated_quiz is not None:
+        return save_quiz(pregenerated_quiz['questions'], pregenerated_quiz)
+
+    selection = select_module_quiz(attempt_id)
+    if selection is None:
+        return None
+    question_ids, quiz_attempt = selection
+    return save_quiz(question_ids, quiz_attempt)
+
+def select_module_quiz(attempt_id: str) -> Optional[Tuple[List[int], Dict]]:
+    module = {}
     quiz_attempt = {}
     try:
         mongo_client = MongoClient(MONGO_URI)
@@ -75,48 +155,135 @@ def generate_module_quiz(attempt_id: str):
         if quiz_attempt is None:
             return None
         
-        courses_collection = mongo_db['courses']
-        questions_db = courses_collection.find_one(
-            {'_id': ObjectId(quiz_attempt['course_id']), 'modules.number': quiz_attempt['module_number']},
-            {'modules.$': 1, '_id': 0}
-        )['modules'][0]['questions']
+        module = find_module(
+            mongo_db,
+            quiz_attempt['course_id'],
+            quiz_attempt['module_number'],
+            ['questions', 'question_embeddings']
+        )
+
+        if module is None:
+            return None
     except Exception as e:
         print('Error: cannot retrieve quiz attempt from database.', e)
     finally:
         mongo_client.close()
 
-    incorrecty_answered_question_ids = [question['question_index'] for question in quiz_attempt['answers'] if not question['is_correct']]
+    question_num = len(module['questions'])
+    incorrecty_answered_question_ids = [
+        question['question_index'] for question in quiz_attempt['answers']
+        if not question['is_correct'] and 0 <= question['question_index'] < question_num
+    ]
 
     if len(incorrecty_answered_question_ids) == 0:
-        result = []
-        while len(result) < 10:
-            question_id = randint(0, 19)
-            if question_id not in result:
-                result.append(question_id)
-        result = sorted(result)
-        return save_quiz(result, quiz_attempt)
+        return sorted(sample(range(question_num), min(MODULE_QUIZ_SIZE, question_num))), quiz_attempt
 
-    
-    incorrecty_answered_questions_text = ''
-    for question_id in incorrecty_answered_question_ids:
-        question_text = str(question_id+1) + '. ' + questions_db[question_id]['question'] + '\n'
-        option_text = '\n'.join(key + ') ' + value for key, value in questions_db[question_id]['options'].items())
-        incorrecty_answered_questions_text += question_text + option_text + '\n\n'
-    
-    question_db_text = ''
-    for i, question in enumerate(questions_db, 1):
-        question_text = str(i) + '. ' + question['question'] + '\n'
-        option_text = '\n'.join(key + ') ' + value for key, value in question['options'].items())
-        question_db_text += question_text + option_text + '\n\n'
-    
-    prompt = ChatPromptTemplate.from_template(prompt_template).format(
-        incorrecty_answered_questions=incorrecty_answered_questions_text,
-        questions=question_db_text,
-    )
-    response = get_model_response(prompt)
-    result = response.split(', ')
-    result = [int(num) for num in result]
-    return save_quiz(result, quiz_attempt)
+    return select_questions(module, incorrecty_answered_question_ids), quiz_attempt
+
+
+def ensure_pregeneration_indexes():
+    if not PREGENERATE_MODULE_QUIZZES:
+        return
+    try:
+        mongo_client = MongoClient(MONGO_URI)
+        mongo_db = mongo_client[MONGO_DB_NAME]
+        mongo_db['pregenerated_quizzes'].create_index('created_at', expireAfterSeconds=PREGENERATED_QUIZ_TTL_SECONDS)
+    except Exception as e:
+        print('Error: cannot create pre-generated quiz indexes:', e)
+    finally:
+        mongo_client.close()
+
+
+def pregenerate_module_quiz(attempt_id: str):
+    with llm_priority(LANE_BATCH):
+        selection = select_module_quiz(attempt_id)
+    if selection is None:
+        return
+    question_ids, quiz_attempt = selection
+
+    try:
+        mongo_client = MongoClient(MONGO_URI)
+        mongo_db = mongo_client[MONGO_DB_NAME]
+        pregenerated_quizzes_collection = mongo_db['pregenerated_quizzes']
+        owner = {'course_id': quiz_attempt['course_id'], 'user_id': quiz_attempt['user_id']}
+
+        # Only the latest attempt of a learner in a course can be turned into their next quiz.
+        if pregenerated_quizzes_collection.find_one({**owner, 'attempt_id': {'$gt': quiz_attempt['_id']}}, {'_id': 1}):
+            return
+        pregenerated_quizzes_collection.delete_many({**owner, 'attempt_id': {'$lt': quiz_attempt['_id']}})
+        pregenerated_quizzes_collection.replace_one(
+            {'_id': attempt_id},
+            {
+                **owner,
+                'attempt_id': quiz_attempt['_id'],
+                'module_number': quiz_attempt['module_number'],
+                'questions': question_ids,
+                'created_at': datetime.now(timezone.utc)
+            },
+            upsert=True
+        )
+    except Exception as e:
+        print('Error: cannot store pre-generated quiz in a database:', e)
+    finally:
+        mongo_client.close()
+
+
+def _forget_pregeneration(attempt_id: str):
+    with _pregeneration_lock:
+        _pregenerations.pop(attempt_id, None)
+
+def schedule_module_quiz_pregeneration(attempt_id: str) -> bool:
+    if not PREGENERATE_MODULE_QUIZZES or not ObjectId.is_valid(attempt_id):
+        return False
+    with _pregeneration_lock:
+        if attempt_id in _pregenerations:
+            return True
+        future = metrics.submit(_pregeneration_executor, pregenerate_module_quiz, attempt_id)
+        _pregenerations[attempt_id] = future
+    future.add_done_callback(lambda _: _forget_pregeneration(attempt_id))
+    return True
+
+def take_pregenerated_quiz(attempt_id: str) -> Optional[Dict]:
+    # A pre-generation that is still running is cheaper to wait for than to repeat.
+    with _pregeneration_lock:
+        future = _pregenerations.get(attempt_id)
+    if future is not None:
+        try:
+            future.result(timeout=PREGENERATION_WAIT_SECONDS)
+        except Exception as e:
+            print('Error: pre-generation of the quiz did not finish:', e)
+
+    try:
+        mongo_client = MongoClient(MONGO_URI)
+        mongo_db = mongo_client[MONGO_DB_NAME]
+        return mongo_db['pregenerated_quizzes'].find_one_and_delete({'_id': attempt_id})
+    except Exception as e:
+        print('Error: cannot retrieve pre-generated quiz from database.', e)
+    finally:
+        mongo_client.close()
+
+def watch_quiz_attempts(stop: threading.Event):
+    # Change streams need MongoDB to run as a replica set.
+    while not stop.is_set():
+        try:
+            mongo_client = MongoClient(MONGO_URI)
+            mongo_db = mongo_client[MONGO_DB_NAME]
+            pipeline = [{'$match': {'operationType': 'insert'}}]
+            with mongo_db['quiz_attempts'].watch(pipeline, max_await_time_ms=1000) as stream:
+                while not stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        schedule_module_quiz_pregeneration(str(change['documentKey']['_id']))
+        except Exception as e:
+            print('Error: cannot watch quiz attempts:', e)
+            stop.wait(PREGENERATION_WATCH_RETRY_SECONDS)
+        finally:
+            mongo_client.close()
+
+def start_quiz_attempt_watcher() -> threading.Event:
+    stop = threading.Event()
+    threading.Thread(target=watch_quiz_attempts, args=(stop,), name='quiz-attempt-watcher', daemon=True).start()
+    return stop
 
 
 def round_preserving_sum(arr: List[float]) -> List[int]:
@@ -134,9 +301,31 @@ def round_preserving_sum(arr: List[float]) -> List[int]:
 
     return floor_arr
 
+def generate_module_questions(template: str, question_num: int, **kwargs) -> List[Dict]:
+    prompt_template = ChatPromptTemplate.from_template(template)
+    return generate_question_set(
+        lambda missing: prompt_template.format(question_num=missing, format=question_format(), **kwargs),
+        question_num,
+        MODEL_NAME
+    )
+
+def generate_unseen_questions(template: str, question_num: int, seen: set, **kwargs) -> List[Dict]:
+    # Questions the learner was already served are dropped and generated again once.
+    questions = []
+    for _ in range(2):
+        missing = question_num - len(questions)
+        if missing <= 0:
+            break
+        questions += unseen(generate_module_questions(template, missing, **kwargs), seen)
+    return questions
+
 def generate_final_quiz(course_id: str, user_id: str):
+    with llm_priority(LANE_QUIZ, user_id):
+        return _generate_final_quiz(course_id, user_id)
+
+def _generate_final_quiz(course_id: str, user_id: str):
     result = []
-    course = None
+    modules = []
     attempts = None
     mistake_questions: List[List[int]] = []
     module_question_lens: List[int] = []
@@ -146,12 +335,13 @@ def generate_final_quiz(course_id: str, user_id: str):
         mongo_client = MongoClient(MONGO_URI)
         mongo_db = mongo_client[MONGO_DB_NAME]
 
-        courses_collection = mongo_db['courses']
-        course = courses_collection.find_one({'_id': ObjectId(course_id)})
+        modules = find_modules(mongo_db, course_id, ['content', 'questions'])
+        if not modules:
+            return None
         
         quiz_attempts_collection = mongo_db['quiz_attempts']
         mistake_scores = []
-        for i in range(len(course['modules'])):
+        for i in range(len(modules)):
             attempts = list(quiz_attempts_collection.find({'course_id': course_id, 'user_id': user_id, 'module_number': i+1}))
             if attempts == []:
                 return None
@@ -190,19 +380,7 @@ def generate_final_quiz(course_id: str, user_id: str):
         "- Only one option should be correct.\n"
         "- Provide the correct answer after each question.\n"
         "- Questions can be paraphrased or have similarities.\n\n"
-        "* Format: *\n"
-        "1. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
-        "2. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
+        "{format}"
         "* Module Content: *\n{context}\n\n"
         "* User's incorrectly answered questions: *\n{incorrecty_answered_questions}\n"
         "* Available questions in the database: *\n{questions}"
@@ -217,54 +395,88 @@ def generate_final_quiz(course_id: str, user_id: str):
         "- Only one option should be correct.\n"
         "- Provide the correct answer after each question.\n"
         "- Questions can be paraphrased or have similarities.\n\n"
-        "* Format: *\n"
-        "1. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
-        "2. [Question text]\n"
-        "a) [Option A]\n"
-        "b) [Option B]\n"
-        "c) [Option C]\n"
-        "d) [Option D]\n"
-        "Answer: [a/b/c/d]\n\n"
+        "{format}"
         "* Module Content: *\n{context}\n\n"
         "* Available questions in the database: *\n{questions}"
     )
 
-    for i, module in enumerate(course['modules']):
-        prompt = ''
+    prompts = []
+    for i, module in enumerate(modules):
+        if module_question_lens[i] == 0:
+            continue
+
         question_db_text = ''
         for j, question in enumerate(module['questions'], 1):
             question_text = str(j) + '. ' + question['question'] + '\n'
             option_text = '\n'.join(key + ') ' + value for key, value in question['options'].items())
             question_db_text += question_text + option_text + '\n\n'
 
-        if mistake_questions[i] == []:
-            prompt = ChatPromptTemplate.from_template(prompt_template2).format(
-                question_num=module_question_lens[i],
-                context=module['content'],
-                questions=question_db_text
-            )
+        mistake_module_questions = [question_id for question_id in mistake_questions[i] if 0 <= question_id < len(module['questions'])]
+        signature = mistake_signature(mistake_module_questions)
+        if mistake_module_questions == []:
+            prompts.append((i + 1, signature, prompt_template2, module_question_lens[i], {
+                'context': module['content'],
+                'questions': question_db_text
+            }))
         else:
             incorrecty_answered_questions_text = ''
-            for question_id in mistake_questions[i]:
+            for question_id in mistake_module_questions:
                 question_text = str(question_id+1) + '. ' + module['questions'][question_id]['question'] + '\n'
                 option_text = '\n'.join(key + ') ' + value for key, value in module['questions'][question_id]['options'].items())
                 incorrecty_answered_questions_text += question_text + option_text + '\n\n'
             
-            prompt = ChatPromptTemplate.from_template(prompt_template1).format(
-                question_num=module_question_lens[i],
-                context=module['content'],
-                incorrecty_answered_questions=incorrecty_answered_questions_text,
-                questions=question_db_text
-            )
-        
-        response = get_model_response(prompt)
-        result += parse_questions(response)
+            prompts.append((i + 1, signature, prompt_template1, module_question_lens[i], {
+                'context': module['content'],
+                'incorrecty_answered_questions': incorrecty_answered_questions_text,
+                'questions': question_db_text
+            }))
     
+    pooled_questions: Dict[int, List[Dict]] = {module_number: [] for module_number, *_ in prompts}
+    seen_questions = set()
+    if FINAL_QUIZ_POOL:
+        try:
+            mongo_client = MongoClient(MONGO_URI)
+            mongo_db = mongo_client[MONGO_DB_NAME]
+            ensure_pool_indexes(mongo_db)
+            seen_questions = seen_pool_questions(mongo_db, course_id, user_id)
+            for module_number, signature, _, question_num, _ in prompts:
+                pooled_questions[module_number] = take_pool_questions(
+                    mongo_db, course_id, module_number, signature, user_id, question_num, seen_questions
+                )
+        except Exception as e:
+            print('Error: cannot retrieve questions from the final quiz pool.', e)
+        finally:
+            mongo_client.close()
+
+    # Only the questions the pool could not provide are generated.
+    with ThreadPoolExecutor(max_workers=max(1, FINAL_QUIZ_CONCURRENCY)) as executor:
+        futures = {
+            module_number: metrics.submit(
+                executor, generate_unseen_questions, template,
+                question_num - len(pooled_questions[module_number]), seen_questions, **kwargs
+            )
+            for module_number, _, template, question_num, kwargs in prompts
+            if question_num > len(pooled_questions[module_number])
+        }
+        generated_questions = {module_number: future.result() for module_number, future in futures.items()}
+
+    for module_number, *_ in prompts:
+        result += pooled_questions[module_number] + generated_questions.get(module_number, [])
+
+    if FINAL_QUIZ_POOL and generated_questions:
+        try:
+            mongo_client = MongoClient(MONGO_URI)
+            mongo_db = mongo_client[MONGO_DB_NAME]
+            for module_number, signature, *_ in prompts:
+                add_pool_questions(
+                    mongo_db, course_id, module_number, signature, user_id,
+                    generated_questions.get(module_number, [])
+                )
+        except Exception as e:
+            print('Error: cannot add questions to the final quiz pool.', e)
+        finally:
+            mongo_client.close()
+
     try:
         mongo_client = MongoClient(MONGO_URI)
         mongo_db = mongo_client[MONGO_DB_NAME]
@@ -0,0 +1,332 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Callable, Any, Optional, Deque, Tuple
+from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge, Histogram
+
+import metrics
+
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', 1))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 5))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1.0))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 60.0))
+LLM_INTERACTIVE_RESERVED = int(os.getenv('LLM_INTERACTIVE_RESERVED', 2))
+
+# Requests per minute for each model, "model=rpm" separated by commas.
+DEFAULT_RPM = int(os.getenv('LLM_DEFAULT_RPM', 60))
+MODEL_RPM: Dict[str, int] = {
+    model.strip(): int(rpm)
+    for model, rpm in (item.split('=') for item in os.getenv('LLM_MODEL_RPM', '').split(',') if '=' in item)
+}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+LANE_INTERACTIVE = 'interactive'
+LANE_QUIZ = 'quiz'
+LANE_BATCH = 'batch'
+DEFAULT_OWNER = 'default'
+
+_current_priority: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar(
+    'llm_priority', default=(LANE_BATCH, DEFAULT_OWNER)
+)
+
+GATEWAY_CALLS = Counter('llm_gateway_calls_total', 'LLM calls made through the gateway.', ['model', 'outcome'])
+GATEWAY_RETRIES = Counter('llm_gateway_retries_total', 'LLM call retries.', ['model', 'status'])
+GATEWAY_CONCURRENCY = Gauge('llm_gateway_concurrency_limit', 'Current adaptive concurrency limit.')
+GATEWAY_IN_FLIGHT = Gauge('llm_gateway_in_flight', 'LLM calls in flight.')
+GATEWAY_QUEUED = Gauge('llm_gateway_queued', 'LLM calls waiting for a slot.', ['lane'])
+GATEWAY_WAIT_SECONDS = Histogram(
+    'llm_gateway_wait_seconds', 'Time LLM calls wait for a slot and a rate-limit token.', ['lane'],
+    buckets=metrics.LATENCY_BUCKETS
+)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: int):
+        self.capacity = max(1, rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        # Takes a token and returns 0, or returns the seconds until the next token is available.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    __slots__ = ('lane', 'owner', 'bucket', 'granted', 'window')
+
+    def __init__(self, lane: str, owner: str, bucket: Optional[TokenBucket] = None):
+        self.lane = lane
+        self.owner = owner
+        self.bucket = bucket
+        self.granted = False
+        self.window = 0
+
+
+class AIMDLimiter:
+    def __init__(self, max_limit: int, min_limit: int = 1, interactive_reserved: int = 0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.interactive_reserved = max(0, interactive_reserved)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        # Bumped on every decrease; calls admitted before it cannot cause another one.
+        self.window = 0
+        # Seconds until a rate-limited ticket may get a token, None when no ticket waits for one.
+        self.retry_after: Optional[float] = None
+        self.condition = threading.Condition()
+        self.interactive: Deque[Ticket] = deque()
+        self.quiz: Deque[Ticket] = deque()
+        # Batch work is queued per owner and owners are served round-robin.
+        self.batch: 'OrderedDict[str, Deque[Ticket]]' = OrderedDict()
+        GATEWAY_CONCURRENCY.set(self.limit)
+
+    def _shared_limit(self) -> int:
+        return max(1, int(self.limit) - self.interactive_reserved)
+
+    def _take_token(self, ticket: Ticket, blocked: Dict[TokenBucket, float]) -> bool:
+        # Once a model is out of tokens no lower-priority ticket for it may take the next one.
+        if ticket.bucket is None:
+            return True
+        if ticket.bucket in blocked:
+            return False
+        wait = ticket.bucket.try_acquire()
+        if wait > 0:
+            blocked[ticket.bucket] = wait
+            return False
+        return True
+
+    def _take_from(self, tickets: Deque[Ticket], blocked: Dict[TokenBucket, float]) -> Optional[Ticket]:
+        for ticket in tickets:
+            if self._take_token(ticket, blocked):
+                tickets.remove(ticket)
+                return ticket
+        return None
+
+    def _next_ticket(self, blocked: Dict[TokenBucket, float]) -> Optional[Ticket]:
+        if self.in_flight >= int(self.limit):
+            return None
+        ticket = self._take_from(self.interactive, blocked)
+        if ticket is not None:
+            return ticket
+        if self.in_flight >= self._shared_limit():
+            return None
+        ticket = self._take_from(self.quiz, blocked)
+        if ticket is not None:
+            return ticket
+        for owner in list(self.batch):
+            tickets = self.batch[owner]
+            ticket = self._take_from(tickets, blocked)
+            if ticket is not None:
+                del self.batch[owner]
+                if tickets:
+                    self.batch[owner] = tickets
+                return ticket
+        return None
+
+    def _dispatch(self):
+        # Slots and rate-limit tokens are both handed out here, in lane and owner order.
+        granted = False
+        blocked: Dict[TokenBucket, float] = {}
+        ticket = self._next_ticket(blocked)
+        while ticket is not None:
+            ticket.granted = True
+            ticket.window = self.window
+            self.in_flight += 1
+            granted = True
+            ticket = self._next_ticket(blocked)
+        waiting_for_token = self.retry_after is None and blocked
+        self.retry_after = min(blocked.values()) if blocked else None
+        if granted:
+            GATEWAY_IN_FLIGHT.set(self.in_flight)
+        # Waiters that went to sleep with no timeout must learn when the next token is due.
+        if granted or waiting_for_token:
+            self.condition.notify_all()
+
+    def acquire(self, lane: str = LANE_BATCH, owner: str = DEFAULT_OWNER, bucket: Optional[TokenBucket] = None) -> Ticket:
+        ticket = Ticket(lane, owner, bucket)
+        with self.condition:
+            if lane == LANE_INTERACTIVE:
+                self.interactive.append(ticket)
+            elif lane == LANE_QUIZ:
+                self.quiz.append(ticket)
+            else:
+                self.batch.setdefault(owner, deque()).append(ticket)
+            GATEWAY_QUEUED.labels(lane).inc()
+            self._dispatch()
+            while not ticket.granted:
+                # Without a release to wake them, waiters retry when the next token is due.
+                self.condition.wait(self.retry_after)
+                if not ticket.granted:
+                    self._dispatch()
+            GATEWAY_QUEUED.labels(lane).dec()
+        return ticket
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            GATEWAY_IN_FLIGHT.set(self.in_flight)
+            self._dispatch()
+
+    def on_success(self):
+        with self.condition:
+            # Additive increase: one extra slot per "limit" successful calls.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            GATEWAY_CONCURRENCY.set(self.limit)
+            self._dispatch()
+
+    def on_overload(self, ticket: Ticket):
+        with self.condition:
+            # A burst of 429s from calls of the same window halves the limit only once.
+            if ticket.window < self.window:
+                return
+            self.window += 1
+            self.limit = max(self.min_limit, self.limit / 2)
+            GATEWAY_CONCURRENCY.set(self.limit)
+
+
+@contextmanager
+def llm_priority(lane: str, owner: str = DEFAULT_OWNER):
+    token = _current_priority.set((lane, owner))
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for attribute in ('code', 'status_code'):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    if isinstance(value, int):
+        return value
+    if 'RESOURCE_EXHAUSTED' in str(error):
+        return 429
+    return None
+
+
+class LLMGateway:
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self.limiter = AIMDLimiter(LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY, LLM_INTERACTIVE_RESERVED)
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                from google import genai
+                self._client = genai.Client(api_key=GEMINI_API_KEY)
+            return self._client
+
+    @client.setter
+    def client(self, value):
+        with self._client_lock:
+            self._client = value
+
+    def _bucket(self, model: str) -> TokenBucket:
+        with self._buckets_lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(MODEL_RPM.get(model, DEFAULT_RPM))
+            return self._buckets[model]
+
+    def call(self, model: str, fn: Callable[[], Any], lane: Optional[str] = None, owner: Optional[str] = None) -> Any:
+        current_lane, current_owner = _current_priority.get()
+        lane = lane or current_lane
+        owner = owner or current_owner
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            # The slot and the model's rate-limit token are granted together, in priority order.
+            ticket = self.limiter.acquire(lane, owner, self._bucket(model))
+            try:
+                GATEWAY_WAIT_SECONDS.labels(lane).observe(time.perf_counter() - start)
+                result = fn()
+            except Exception as e:
+                status = _status_code(e)
+                if status not in RETRYABLE_STATUS_CODES or attempt >= LLM_MAX_RETRIES:
+                    GATEWAY_CALLS.labels(model, 'error').inc()
+                    raise
+                if status == 429:
+                    self.limiter.on_overload(ticket)
+                GATEWAY_RETRIES.labels(model, str(status)).inc()
+            else:
+                self.limiter.on_success()
+                GATEWAY_CALLS.labels(model, 'success').inc()
+                return result
+            finally:
+                self.limiter.release()
+
+            # Full jitter keeps concurrent retries from hitting the API at the same moment.
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            time.sleep(delay)
+            attempt += 1
+
+    def generate(self, model: str, contents, **kwargs) -> str:
+        response = self.call(model, lambda: self.client.models.generate_content(model=model, contents=contents, **kwargs))
+        metrics.record_genai_response(model, response)
+        return response.text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'calls': {
+                '/'.join(sample.labels.values()): sample.value
+                for metric in GATEWAY_CALLS.collect() for sample in metric.samples if sample.name.endswith('_total')
+            },
+            'retries': {
+                '/'.join(sample.labels.values()): sample.value
+                for metric in GATEWAY_RETRIES.collect() for sample in metric.samples if sample.name.endswith('_total')
+            },
+        }
+
+
+gateway = LLMGateway()
+
+
+if __name__ == '__main__':
+    # A chat call that arrives while batch calls wait for an empty rate-limit bucket goes first.
+    check = LLMGateway()
+    bucket = check._bucket('check-model')
+    bucket.rate = 5.0
+    bucket.tokens = 0.0
+    order = []
+    threads = [
+        threading.Thread(target=check.call, args=('check-model', lambda i=i: order.append(f'batch-{i}'), LANE_BATCH, f'course-{i}'))
+        for i in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    check.call('check-model', lambda: order.append('chat'), LANE_INTERACTIVE)
+    for thread in threads:
+        thread.join()
+    assert order[0] == 'chat', order
+    print('Chat call overtook queued batch calls:', order)
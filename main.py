@@ -1,19 +1,89 @@
 import os
-from typing import List
+import time
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from uuid import uuid4
-from fastapi import FastAPI, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, HTTPException, Form, File, UploadFile, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from anyio import to_thread, CapacityLimiter
 from sse_starlette.sse import EventSourceResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 from chatbot import ChatBot, sessions
+from chat_history import CHAT_HISTORY_PAGE_SIZE
+
+import metrics
+import warmup
+from single_flight import single_flight
 
 from generate_course import generate_course
-from generate_quiz import generate_module_quiz as gen_module_quiz, generate_final_quiz as gen_final_quiz
+from generate_quiz import (
+    generate_module_quiz as gen_module_quiz,
+    generate_final_quiz as gen_final_quiz,
+    schedule_module_quiz_pregeneration,
+    ensure_pregeneration_indexes,
+    start_quiz_attempt_watcher
+)
 from delete_course import delete_course as del_course
 
 
 UPLOAD_FOLDER = "uploaded_files"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-app = FastAPI(title="RAG Course API")
+# Course builds get their own worker threads so they cannot take the ones serving chat and quizzes.
+COURSE_GENERATION_THREADS = int(os.getenv('COURSE_GENERATION_THREADS', 4))
+course_generation_limiter = CapacityLimiter(COURSE_GENERATION_THREADS)
+_STOP = object()
+
+WARM_UP_ON_STARTUP = os.getenv('WARM_UP_ON_STARTUP', 'true').lower() == 'true'
+WATCH_QUIZ_ATTEMPTS = os.getenv('WATCH_QUIZ_ATTEMPTS', 'false').lower() == 'true'
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy models load on first use; warm them in the background so startup stays fast.
+    if WARM_UP_ON_STARTUP:
+        warmup.start_background_warm_up(bot)
+    else:
+        warmup.mark_ready()
+    await to_thread.run_sync(ensure_pregeneration_indexes)
+    watcher = start_quiz_attempt_watcher() if WATCH_QUIZ_ATTEMPTS else None
+    yield
+    if watcher is not None:
+        watcher.set()
+
+
+app = FastAPI(title="RAG Course API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template keeps the label set bounded; unknown paths share one label.
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        if endpoint != "/metrics":
+            metrics.REQUEST_SECONDS.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start)
+
+
+@app.get("/ready")
+def ready():
+    status = warmup.status()
+    if not warmup.is_ready():
+        return JSONResponse(status_code=503, content={'ready': False, 'components': status})
+    return {'ready': True, 'components': status}
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.latest(), media_type=CONTENT_TYPE_LATEST)
+
 
 @app.post("/generate")
 async def create_course(
@@ -47,16 +117,28 @@ async def create_course(
     
     async def event_generator():
         try:
-            for message in generate_course(owner, title, files_paths):
+            messages = generate_course(owner, title, files_paths)
+            while True:
+                message = await to_thread.run_sync(next, messages, _STOP, limiter=course_generation_limiter)
+                if message is _STOP:
+                    break
                 yield message
         except Exception as e:
             HTTPException(status_code=500, detail=str(e))
         finally:
-            for file_path in files_paths:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+            remove_files(files_paths)
+
+    # A repeated request for the same course follows the build that is already running.
+    events, started = single_flight.stream(('generate', owner, title), event_generator)
+    if not started:
+        remove_files(files_paths)
+    return EventSourceResponse(events)
 
-    return EventSourceResponse(event_generator())
+
+def remove_files(files_paths: List[str]):
+    for file_path in files_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 
 @app.delete("/delete")
@@ -77,7 +159,11 @@ async def generate_module_quiz(
 ):
     quiz_id = None
     try:
-        quiz_id = gen_module_quiz(attempt_id)
+        with metrics.track('generate_module_quiz'):
+            quiz_id = await single_flight.do(
+                ('generate_module_quiz', attempt_id),
+                lambda: run_in_threadpool(gen_module_quiz, attempt_id)
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -86,6 +172,15 @@ async def generate_module_quiz(
     return {'message': 'New quiz has been successfully generated.', 'quiz_id': str(quiz_id)}
 
 
+@app.post("/quiz-attempt-recorded", status_code=202)
+async def quiz_attempt_recorded(
+    attempt_id: str = Form(...)
+):
+    if not schedule_module_quiz_pregeneration(attempt_id):
+        return {'message': 'Quiz pre-generation is skipped.'}
+    return {'message': 'Next quiz is being prepared.'}
+
+
 @app.post("/generate-final-quiz")
 async def generate_final_quiz(
     course_id: str = Form(...),
@@ -93,7 +188,11 @@ async def generate_final_quiz(
 ):
     quiz_id = None
     try:
-        quiz_id = gen_final_quiz(course_id, user_id)
+        with metrics.track('generate_final_quiz'):
+            quiz_id = await single_flight.do(
+                ('generate_final_quiz', course_id, user_id),
+                lambda: run_in_threadpool(gen_final_quiz, course_id, user_id)
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -128,7 +227,8 @@ def send_message(
         raise HTTPException(status_code=404, detail="Session not found")
     
     try:
-        response = bot.process_message(session_id, message)
+        with metrics.track('send_message'):
+            response = bot.process_message(session_id, message)
         return {"response": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -139,6 +239,30 @@ def get_history(session_id: str = Form(...)):
     return {'message': 'Conversation history has been successfully sent.', 'history': history}
 
 
+@app.post("/get-history-page")
+def get_history_page(
+    session_id: str = Form(...),
+    cursor: Optional[int] = Form(None),
+    limit: int = Form(CHAT_HISTORY_PAGE_SIZE)
+):
+    page = bot.get_history_page(session_id, cursor, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {'message': 'Conversation history page has been successfully sent.', **page}
+
+
+@app.post("/get-history-since")
+def get_history_since(
+    session_id: str = Form(...),
+    since: int = Form(0),
+    limit: int = Form(CHAT_HISTORY_PAGE_SIZE)
+):
+    turns = bot.get_history_since(session_id, since, limit)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {'message': 'New conversation turns have been successfully sent.', **turns}
+
+
 @app.post("/close-session")
 def close_session(session_id: str = Form(...)):
     bot.close_session(session_id)
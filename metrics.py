@@ -0,0 +1,197 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+from prometheus_client import Counter, Histogram, generate_latest
+from pymongo import monitoring
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320, 640)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ['endpoint', 'method', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'stage_duration_seconds', 'Duration of pipeline and request stages.', ['stage'],
+    buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter('llm_calls_total', 'LLM calls.', ['stage', 'model'])
+LLM_TOKENS = Counter('llm_tokens_total', 'LLM tokens.', ['stage', 'model', 'kind'])
+VECTOR_SEARCHES = Counter('vector_searches_total', 'Vector database searches.', ['stage'])
+MONGO_ROUND_TRIPS = Counter('mongo_round_trips_total', 'MongoDB commands sent.', ['stage'])
+CONTEXT_TOKENS = Counter('context_tokens_total', 'Reference context tokens put in prompts.', ['stage'])
+CONTEXT_TOKENS_SAVED = Counter('context_tokens_saved_total', 'Reference context tokens saved by packing.', ['stage'])
+TABLE_TOKENS = Counter('table_tokens_total', 'Tokens of tables found in uploads.', ['format'])
+SUMMARY_FALLBACKS = Counter('summary_fallbacks_total', 'Chunks summarized alone after a packed request missed them.', ['stage'])
+
+CHAT_ROUTES = Counter('chat_routes_total', 'Chat turns by routing decision.', ['route'])
+CHAT_TURN_SECONDS = Histogram(
+    'chat_turn_duration_seconds', 'Chat turn latency by routing decision.', ['route'],
+    buckets=LATENCY_BUCKETS
+)
+
+STAT_FIELDS = ['llm_calls', 'prompt_tokens', 'response_tokens', 'vector_searches', 'mongo_round_trips']
+
+_current_stats: contextvars.ContextVar[Optional['StageStats']] = contextvars.ContextVar('stage_stats', default=None)
+
+
+class StageStats:
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.duration = 0.0
+        self.counts: Dict[str, int] = {field: 0 for field in STAT_FIELDS}
+        self.lock = threading.Lock()
+
+    def add(self, field: str, value: int = 1):
+        with self.lock:
+            self.counts[field] = self.counts.get(field, 0) + value
+
+    def merge(self, other: 'StageStats'):
+        with self.lock:
+            self.duration += other.duration
+            for field, value in other.counts.items():
+                self.counts[field] = self.counts.get(field, 0) + value
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {'stage': self.stage, 'duration': round(self.duration, 3), **self.counts}
+
+
+def _current_stage() -> str:
+    stats = _current_stats.get()
+    return stats.stage if stats is not None else 'other'
+
+
+def finish(stats: StageStats, duration: float, parent: Optional[StageStats] = None):
+    stats.duration = duration
+    STAGE_SECONDS.labels(stats.stage).observe(duration)
+    if parent is not None:
+        parent.merge(stats)
+
+
+@contextmanager
+def use(stats: StageStats):
+    # Attributes work to a stage that is already running, e.g. from a generator between two yields.
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def track(stage: str, parent: Optional[StageStats] = None):
+    stats = StageStats(stage)
+    start = time.perf_counter()
+    try:
+        with use(stats):
+            yield stats
+    finally:
+        finish(stats, time.perf_counter() - start, parent)
+
+
+def submit(executor, fn, *args, **kwargs):
+    # Worker threads do not inherit context variables, so run each task in a copy of the caller's context.
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def start_thread(fn, *args, name: Optional[str] = None) -> threading.Thread:
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(fn, *args), name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def record_llm_call(model: str, prompt_tokens: Optional[int], response_tokens: Optional[int]):
+    prompt_tokens = prompt_tokens or 0
+    response_tokens = response_tokens or 0
+    stage = _current_stage()
+    LLM_CALLS.labels(stage, model).inc()
+    LLM_TOKENS.labels(stage, model, 'prompt').inc(prompt_tokens)
+    LLM_TOKENS.labels(stage, model, 'response').inc(response_tokens)
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add('llm_calls')
+        stats.add('prompt_tokens', prompt_tokens)
+        stats.add('response_tokens', response_tokens)
+
+
+def record_genai_response(model: str, response):
+    usage = getattr(response, 'usage_metadata', None)
+    record_llm_call(
+        model,
+        getattr(usage, 'prompt_token_count', 0),
+        getattr(usage, 'candidates_token_count', 0)
+    )
+
+
+def record_context_packing(tokens: int, tokens_saved: int):
+    stage = _current_stage()
+    CONTEXT_TOKENS.labels(stage).inc(tokens)
+    CONTEXT_TOKENS_SAVED.labels(stage).inc(tokens_saved)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add('context_tokens', tokens)
+        stats.add('context_tokens_saved', tokens_saved)
+
+
+def record_table_tokens(html_tokens: int, serialized_tokens: int):
+    TABLE_TOKENS.labels('html').inc(html_tokens)
+    TABLE_TOKENS.labels('serialized').inc(serialized_tokens)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add('table_tokens_html', html_tokens)
+        stats.add('table_tokens', serialized_tokens)
+
+
+def record_summary_fallbacks(count: int):
+    if count <= 0:
+        return
+    SUMMARY_FALLBACKS.labels(_current_stage()).inc(count)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add('summary_fallbacks', count)
+
+
+def record_chat_route(route: str, seconds: float):
+    CHAT_ROUTES.labels(route).inc()
+    CHAT_TURN_SECONDS.labels(route).observe(seconds)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(f'route_{route}')
+
+
+def record_vector_search(count: int = 1):
+    VECTOR_SEARCHES.labels(_current_stage()).inc(count)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add('vector_searches', count)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        MONGO_ROUND_TRIPS.labels(_current_stage()).inc()
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.add('mongo_round_trips')
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+monitoring.register(MongoCommandListener())
+
+
+def progress_events(message: str, stats: StageStats):
+    yield {'data': message}
+    yield {'event': 'metrics', 'data': json.dumps(stats.to_dict())}
+
+
+def latest() -> bytes:
+    return generate_latest()
@@ -0,0 +1,50 @@
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from course_store import (
+    COURSES_COLLECTION, MODULES_COLLECTION, OUTLINE_FIELDS, STORAGE_VERSION,
+    ensure_indexes, insert_modules, delete_modules, number_modules
+)
+
+
+load_dotenv()
+
+MONGO_URI = os.getenv('MONGO_URI')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
+
+
+def migrate_courses():
+    migrated = 0
+    try:
+        mongo_client = MongoClient(MONGO_URI)
+        mongo_db = mongo_client[MONGO_DB_NAME]
+        ensure_indexes(mongo_db)
+
+        courses_collection = mongo_db[COURSES_COLLECTION]
+        for course in courses_collection.find({'storage_version': {'$ne': STORAGE_VERSION}}):
+            course_id = str(course['_id'])
+            modules = number_modules(course.get('modules', []))
+
+            # Clear leftovers of an interrupted run so the course can be migrated again.
+            delete_modules(mongo_db, course_id)
+            insert_modules(mongo_db, course_id, modules)
+
+            outline = [{field: module[field] for field in OUTLINE_FIELDS if field in module} for module in modules]
+            courses_collection.update_one(
+                {'_id': course['_id']},
+                {'$set': {'modules': outline, 'storage_version': STORAGE_VERSION}}
+            )
+            migrated += 1
+            print(f"Course '{course.get('title')}' is migrated ({len(modules)} modules).")
+    except Exception as e:
+        print('Error: cannot migrate courses to "' + MODULES_COLLECTION + '" collection:', e)
+    finally:
+        mongo_client.close()
+
+    print(f'{migrated} courses are migrated.')
+    return migrated
+
+
+if __name__ == '__main__':
+    migrate_courses()
@@ -0,0 +1,101 @@
+import os
+from datetime import datetime, timezone
+from typing import List, Dict
+from pymongo import ASCENDING
+
+
+# Generated final-quiz questions are shared between learners of a course who made the same mistakes.
+FINAL_QUIZ_POOL = os.getenv('FINAL_QUIZ_POOL', 'true').lower() == 'true'
+FINAL_QUIZ_POOL_MAX_PER_COURSE = int(os.getenv('FINAL_QUIZ_POOL_MAX_PER_COURSE', 2000))
+
+POOL_COLLECTION = 'final_quiz_pool'
+
+
+def mistake_signature(question_ids: List[int]) -> str:
+    return ','.join(str(question_id) for question_id in sorted(set(question_ids)))
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def ensure_indexes(mongo_db):
+    mongo_db[POOL_COLLECTION].create_index(
+        [('course_id', ASCENDING), ('module_number', ASCENDING), ('signature', ASCENDING)]
+    )
+
+
+def seen_questions(mongo_db, course_id: str, user_id: str) -> set:
+    records = mongo_db[POOL_COLLECTION].find(
+        {'course_id': course_id, 'served_to': user_id},
+        {'question.question': 1}
+    )
+    return {_normalize(record['question']['question']) for record in records}
+
+
+def take_questions(
+    mongo_db, course_id: str, module_number: int, signature: str, user_id: str, count: int, seen: set
+) -> List[Dict]:
+    # Entries whose text the learner already saw, under any signature or entry, are skipped;
+    # the texts of the taken entries are added to seen.
+    if count <= 0:
+        return []
+    pool = mongo_db[POOL_COLLECTION]
+    cursor = pool.find(
+        {'course_id': course_id, 'module_number': module_number, 'signature': signature, 'served_to': {'$ne': user_id}},
+        {'question': 1}
+    )
+    records = []
+    for record in cursor:
+        text = _normalize(record['question']['question'])
+        if text in seen:
+            continue
+        seen.add(text)
+        records.append(record)
+        if len(records) == count:
+            break
+    if records:
+        pool.update_many(
+            {'_id': {'$in': [record['_id'] for record in records]}},
+            {'$addToSet': {'served_to': user_id}, '$inc': {'served_count': 1}}
+        )
+    return [record['question'] for record in records]
+
+
+def add_questions(mongo_db, course_id: str, module_number: int, signature: str, user_id: str, questions: List[Dict]):
+    if not questions:
+        return
+    pool = mongo_db[POOL_COLLECTION]
+    now = datetime.now(timezone.utc)
+    pool.insert_many([
+        {
+            'course_id': course_id,
+            'module_number': module_number,
+            'signature': signature,
+            'question': question,
+            'served_to': [user_id],
+            'served_count': 1,
+            'created_at': now
+        }
+        for question in questions
+    ])
+
+    # The oldest questions leave the pool once a course goes over its cap.
+    excess = pool.count_documents({'course_id': course_id}) - FINAL_QUIZ_POOL_MAX_PER_COURSE
+    if excess > 0:
+        oldest = pool.find({'course_id': course_id}, {'_id': 1}).sort('created_at', ASCENDING).limit(excess)
+        pool.delete_many({'_id': {'$in': [record['_id'] for record in oldest]}})
+
+
+def delete_course_pool(mongo_db, course_id: str):
+    mongo_db[POOL_COLLECTION].delete_many({'course_id': course_id})
+
+
+def unseen(questions: List[Dict], seen: set) -> List[Dict]:
+    result = []
+    for question in questions:
+        text = _normalize(question['question'])
+        if text not in seen:
+            seen.add(text)
+            result.append(question)
+    return result
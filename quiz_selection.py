@@ -0,0 +1,48 @@
+import numpy as np
+from typing import List, Dict
+
+
+def question_to_text(question: Dict) -> str:
+    option_text = '\n'.join(key + ') ' + value for key, value in question['options'].items())
+    return question['question'] + '\n' + option_text
+
+
+def embed_questions(questions: List[Dict], embedding) -> List[List[float]]:
+    if not questions:
+        return []
+    return embedding.embed_documents([question_to_text(question) for question in questions])
+
+
+def select_related_questions(
+    question_embeddings: List[List[float]],
+    incorrect_question_ids: List[int],
+    k: int = 10,
+    diversity: float = 0.3
+) -> List[int]:
+    vectors = np.array(question_embeddings, dtype=np.float32)
+    if vectors.ndim != 2 or len(vectors) == 0:
+        return []
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    incorrect_question_ids = [i for i in incorrect_question_ids if 0 <= i < len(vectors)]
+    if not incorrect_question_ids:
+        return []
+
+    # Relevance of a question is its closest similarity to any wrongly answered one.
+    relevance = (vectors @ vectors[incorrect_question_ids].T).max(axis=1)
+    similarity = vectors @ vectors.T
+
+    selected: List[int] = []
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    while len(selected) < min(k, len(vectors)):
+        if selected:
+            scores = (1 - diversity) * relevance - diversity * redundancy
+        else:
+            scores = relevance.copy()
+        scores[selected] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    return sorted(selected)
@@ -0,0 +1,63 @@
+import os
+from typing import List, Dict, Optional
+from dotenv import load_dotenv
+from qdrant_client.http.models import Filter, FieldCondition, MatchValue, QueryRequest, ScoredPoint
+
+import metrics
+from embeddings import get_embedding_function
+
+
+load_dotenv()
+
+COLLECTION_NAME = os.getenv('COLLECTION_NAME')
+
+
+def course_filter(user: str, course: str) -> Filter:
+    return Filter(
+        must=[
+            FieldCondition(key="metadata.user", match=MatchValue(value=user)),
+            FieldCondition(key="metadata.course", match=MatchValue(value=course))
+        ]
+    )
+
+
+def search_batch(
+    client,
+    queries: List[str],
+    user: str,
+    course: str,
+    limit: int,
+    with_vectors: bool = False,
+    query_vectors: Optional[List[List[float]]] = None
+) -> List[List[ScoredPoint]]:
+    if not queries:
+        return []
+
+    # All queries go through the embedding model as one batch and to Qdrant as one request.
+    if query_vectors is None:
+        query_vectors = get_embedding_function().embed_documents(queries)
+    qdrant_filter = course_filter(user, course)
+    requests = [
+        QueryRequest(query=vector, filter=qdrant_filter, limit=limit, with_payload=True, with_vector=with_vectors)
+        for vector in query_vectors
+    ]
+    responses = client.query_batch_points(collection_name=COLLECTION_NAME, requests=requests)
+    metrics.record_vector_search(len(queries))
+    return [response.points for response in responses]
+
+
+def search(client, query: str, user: str, course: str, limit: int, with_vectors: bool = False) -> List[ScoredPoint]:
+    return search_batch(client, [query], user, course, limit, with_vectors)[0]
+
+
+def point_chunk_id(point: ScoredPoint) -> str:
+    return point.payload['metadata']['id']
+
+
+def fetch_chunks(chunks_collection, chunk_ids: List[str]) -> Dict[str, str]:
+    if not chunk_ids:
+        return {}
+    return {
+        record['_id']: record['chunk']
+        for record in chunks_collection.find({'_id': {'$in': list(chunk_ids)}}, {'chunk': 1})
+    }
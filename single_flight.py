@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Tuple
+from prometheus_client import Counter
+
+
+COALESCED_REQUESTS = Counter('coalesced_requests_total', 'Requests attached to an identical in-flight request.', ['endpoint'])
+
+
+class EventLog:
+    # Keeps every event of an in-flight stream so that late joiners replay it from the start.
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self._updated = asyncio.Event()
+
+    def append(self, event: Any):
+        self.events.append(event)
+        self._notify()
+
+    def close(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                return
+            await self._updated.wait()
+
+
+class SingleFlight:
+    # Identical concurrent requests share one computation. The computation runs as its own
+    # task, so a client that disconnects does not cancel it for the others.
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, EventLog] = {}
+        self._tasks = set()
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            COALESCED_REQUESTS.labels(key[0]).inc()
+        return await asyncio.shield(future)
+
+    def stream(self, key: Tuple, produce: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        # Returns the event stream and whether this call started it.
+        log = self._streams.get(key)
+        if log is not None:
+            COALESCED_REQUESTS.labels(key[0]).inc()
+            return log.subscribe(), False
+
+        log = EventLog()
+        self._streams[key] = log
+
+        async def pump():
+            try:
+                async for event in produce():
+                    log.append(event)
+            except Exception as e:
+                print(f'Error: {key[0]} failed:', e)
+            finally:
+                self._streams.pop(key, None)
+                log.close()
+
+        task = asyncio.ensure_future(pump())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return log.subscribe(), True
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,136 @@
+import os
+from html.parser import HTMLParser
+from typing import List, Dict, Optional
+
+
+# "markdown" or "tsv" rewrite the HTML tables found in PDFs, "html" keeps them as they are.
+TABLE_FORMAT = os.getenv('TABLE_FORMAT', 'markdown')
+
+
+def _span(attrs, name: str) -> int:
+    value = dict(attrs).get(name) or '1'
+    return max(1, int(value)) if value.isdigit() else 1
+
+
+class _TableParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[str]] = []
+        self.header_rows: List[bool] = []
+        self.row: Optional[List[str]] = None
+        self.row_is_header = True
+        self.cell: Optional[List[str]] = None
+        self.colspan = 1
+        self.rowspan = 1
+        self.in_thead = False
+        # Column index -> [text, rows still covered] for cells merged down from an earlier row.
+        self.pending: Dict[int, List] = {}
+
+    def _fill_pending(self):
+        while len(self.row) in self.pending:
+            column = len(self.row)
+            text, remaining = self.pending[column]
+            self.row.append(text)
+            if remaining <= 1:
+                del self.pending[column]
+            else:
+                self.pending[column][1] = remaining - 1
+
+    def _start_row(self):
+        self.row = []
+        self.row_is_header = True
+
+    def _end_row(self):
+        if self.row is None:
+            return
+        # Cells merged down into the end of this row still occupy their columns.
+        while self.pending and max(self.pending) >= len(self.row):
+            if len(self.row) in self.pending:
+                self._fill_pending()
+            else:
+                self.row.append('')
+        if self.row:
+            self.rows.append(self.row)
+            self.header_rows.append(self.row_is_header)
+        self.row = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'thead':
+            self.in_thead = True
+        elif tag == 'tr':
+            self._end_row()
+            self._start_row()
+        elif tag in ('td', 'th'):
+            if self.row is None:
+                self._start_row()
+            self._fill_pending()
+            self.row_is_header = self.row_is_header and (tag == 'th' or self.in_thead)
+            self.cell = []
+            self.colspan = _span(attrs, 'colspan')
+            self.rowspan = _span(attrs, 'rowspan')
+        elif tag == 'br' and self.cell is not None:
+            self.cell.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag == 'thead':
+            self.in_thead = False
+        elif tag in ('td', 'th') and self.cell is not None:
+            text = ' '.join(''.join(self.cell).split())
+            # A merged cell is repeated in every column and row it covers so rows keep their alignment.
+            for _ in range(self.colspan):
+                if self.rowspan > 1:
+                    self.pending[len(self.row)] = [text, self.rowspan - 1]
+                self.row.append(text)
+            self.cell = None
+        elif tag == 'tr':
+            self._end_row()
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+
+def parse_html_table(html: str) -> List[List[str]]:
+    parser = _TableParser()
+    parser.feed(html)
+    parser.close()
+    parser._end_row()
+
+    width = max((len(row) for row in parser.rows), default=0)
+    rows = [row + [''] * (width - len(row)) for row in parser.rows]
+    # Tables that run over several pages repeat their header; keep only the first one.
+    header = rows[0] if rows and parser.header_rows[0] else None
+    return [
+        row for i, (row, is_header) in enumerate(zip(rows, parser.header_rows))
+        if i == 0 or not (is_header and row == header)
+    ]
+
+
+def _markdown_cell(text: str) -> str:
+    return text.replace('|', '\\|')
+
+
+def to_markdown(rows: List[List[str]]) -> str:
+    lines = ['| ' + ' | '.join(_markdown_cell(cell) for cell in rows[0]) + ' |']
+    lines.append('|' + '---|' * len(rows[0]))
+    lines += ['| ' + ' | '.join(_markdown_cell(cell) for cell in row) + ' |' for row in rows[1:]]
+    return '\n'.join(lines)
+
+
+def to_tsv(rows: List[List[str]]) -> str:
+    return '\n'.join('\t'.join(cell.replace('\t', ' ') for cell in row) for row in rows)
+
+
+def serialize_table(html: str, table_format: str = TABLE_FORMAT) -> Optional[str]:
+    if table_format == 'html':
+        return html
+    try:
+        rows = parse_html_table(html)
+    except Exception as e:
+        print('Error: cannot parse a table:', e)
+        return None
+    if not rows:
+        return None
+    if table_format == 'tsv':
+        return to_tsv(rows)
+    return to_markdown(rows)
@@ -0,0 +1,14 @@
+from functools import lru_cache
+
+
+ENCODING_NAME = 'cl100k_base'
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    import tiktoken
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+from typing import Dict, Callable, List
+
+
+WARM_UP_COMPONENTS = [
+    component.strip()
+    for component in os.getenv('WARM_UP_COMPONENTS', 'embeddings,tokenizer,llm').split(',')
+    if component.strip()
+]
+
+_status: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_done = threading.Event()
+
+
+def _warm_up_embeddings():
+    from embeddings import get_embedding_function
+    get_embedding_function().embed_query('warm-up')
+
+
+def _warm_up_tokenizer():
+    from tokenizer import count_tokens
+    count_tokens('warm-up')
+
+
+def _warm_up_llm(bot=None):
+    from llm_gateway import gateway
+    gateway.client
+    if bot is not None:
+        bot.llm
+        bot.small_llm
+
+
+def _warm_up_pdf():
+    from unstructured.partition.pdf import partition_pdf  # noqa: F401
+
+
+def warm_up(components: List[str] = None, bot=None) -> Dict[str, Dict]:
+    warmers: Dict[str, Callable[[], None]] = {
+        'embeddings': _warm_up_embeddings,
+        'tokenizer': _warm_up_tokenizer,
+        'llm': lambda: _warm_up_llm(bot),
+        'pdf': _warm_up_pdf,
+    }
+
+    components = components if components is not None else WARM_UP_COMPONENTS
+    for component in components:
+        if component not in warmers:
+            print(f"Warning: unknown warm-up component '{component}'.")
+            continue
+        with _lock:
+            _status[component] = {'state': 'loading'}
+        start = time.perf_counter()
+        try:
+            warmers[component]()
+            state = {'state': 'ready'}
+        except Exception as e:
+            print(f"Error: cannot warm up '{component}':", e)
+            state = {'state': 'failed', 'error': str(e)}
+        state['seconds'] = round(time.perf_counter() - start, 3)
+        with _lock:
+            _status[component] = state
+
+    # A failed component keeps the instance out of rotation; /ready reports which one failed.
+    result = status()
+    if all(state['state'] == 'ready' for state in result.values()):
+        _done.set()
+    return result
+
+
+def start_background_warm_up(bot=None) -> threading.Thread:
+    thread = threading.Thread(target=warm_up, kwargs={'bot': bot}, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def mark_ready():
+    _done.set()
+
+
+def is_ready() -> bool:
+    return _done.is_set()
+
+
+def status() -> Dict[str, Dict]:
+    with _lock:
+        return {component: dict(state) for component, state in _status.items()}